@@ -0,0 +1,138 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+
+from metrics import ADMISSION_QUEUE, LOAD_SHED
+from responses import dumps
+
+
+# Сколько запросов к БД-эндпоинтам обрабатывается одновременно (0 - без ограничения).
+# Разумно держать чуть больше размера асинхронного пула (см. db.create_async_pool): остальные ждут
+# в очереди приложения, а не пула.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "20"))
+# Сколько запросов может ждать в очереди и сколько секунд
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = os.getenv("ADMISSION_RETRY_AFTER", "1")
+# При перегрузке GET-запросы каталога отдаются из кэша, даже устаревшего
+ADMISSION_SERVE_STALE = os.getenv("ADMISSION_SERVE_STALE", "1") == "1"
+
+# Лёгкие маршруты без БД - их не ограничиваем
+EXEMPT_PATHS = {"/", "/ping", "/health", "/ready", "/env", "/metrics", "/docs", "/docs/oauth2-redirect", "/redoc",
+                "/openapi.json"}
+
+# Эндпоинты каталога, которые при перегрузке можно отдать из кэша
+STALE_PATHS = {"/dishes", "/categories", "/dishes/search", "/dishes/batch"}
+
+# Запрос пропущен без слота: только кэш, к БД не ходим (см. db.check_admission)
+serving_stale = ContextVar("serving_stale", default=False)
+
+
+class Overloaded(Exception):
+    """Нет свободного слота: очередь заполнена или ожидание превысило таймаут"""
+
+
+class AdmissionLimiter:
+    """Ограничение одновременных запросов с ограниченной очередью ожидания"""
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max(max_concurrent, 1))
+        self._waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                raise Overloaded("queue_full")
+            self._waiting += 1
+            ADMISSION_QUEUE.inc()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded("queue_timeout")
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE.dec()
+        else:
+            await self._semaphore.acquire()
+
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+async def _send_overloaded(send):
+    body = dumps({"detail": "Service is overloaded, retry later"})
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", ADMISSION_RETRY_AFTER.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Сброс нагрузки: при перегрузке - сразу 503 с Retry-After вместо каскада таймаутов пула.
+
+    GET-запрос каталога без слота (если ADMISSION_SERVE_STALE=1) обрабатывается в режиме
+    "только кэш": ответ из кэша каталога, пусть и устаревший, а если в кэше ничего
+    нет - тот же 503.
+    """
+
+    def __init__(self, app, limiter=None):
+        self.app = app
+        self.limiter = limiter or AdmissionLimiter(
+            ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.limiter.max_concurrent <= 0 or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            async with self.limiter.slot():
+                await self.app(scope, receive, send)
+            return
+        except Overloaded as e:
+            reason = str(e)
+
+        if not ADMISSION_SERVE_STALE or scope["method"] != "GET" or scope["path"] not in STALE_PATHS:
+            LOAD_SHED.labels(reason, "rejected").inc()
+            await _send_overloaded(send)
+            return
+
+        await self._serve_stale(scope, receive, send, reason)
+
+    async def _serve_stale(self, scope, receive, send, reason):
+        rejected = False
+
+        async def send_stale(message):
+            nonlocal rejected
+            if message["type"] == "http.response.start":
+                if message["status"] >= 500:
+                    # В кэше ничего не нашлось, а в БД идти нельзя
+                    rejected = True
+                    await _send_overloaded(send)
+                    return
+                MutableHeaders(raw=message["headers"])["X-Load-Shedding"] = "cache-only"
+            if not rejected:
+                await send(message)
+
+        token = serving_stale.set(True)
+        try:
+            await self.app(scope, receive, send_stale)
+        finally:
+            serving_stale.reset(token)
+        LOAD_SHED.labels(reason, "rejected" if rejected else "stale").inc()
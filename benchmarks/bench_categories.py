@@ -0,0 +1,63 @@
+"""Сравнение /categories (сводка category_stats) с GROUP BY по всей таблице.
+
+Запуск (нужна база с применёнными миграциями):
+
+    python benchmarks/bench_categories.py --sizes 1000 10000 100000 1000000
+
+Для каждого размера блюда генерируются внутри транзакции, которая в конце
+откатывается, поэтому реальные данные в базе не меняются. Таблица dishes
+на время замера заблокирована - не запускайте на рабочей базе.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import psycopg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CATEGORY_STATS_NAIVE_QUERY, CATEGORY_STATS_QUERY  # noqa: E402
+from common import GENERATE_DISHES  # noqa: E402
+from db import get_conninfo  # noqa: E402
+
+
+def measure(cur, query, repeat):
+    """Медиана времени выполнения запроса, мс"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(query)
+        cur.fetchall()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with psycopg.connect(get_conninfo()) as conn:
+        for size in args.sizes:
+            with conn.cursor() as cur:
+                cur.execute("TRUNCATE dishes RESTART IDENTITY;")
+                started = time.perf_counter()
+                cur.execute(GENERATE_DISHES, (size,))
+                insert_ms = round((time.perf_counter() - started) * 1000, 1)
+                cur.execute("ANALYZE dishes;")
+
+                print({
+                    "dishes": size,
+                    "insert_with_triggers_ms": insert_ms,
+                    "summary_table_ms": measure(cur, CATEGORY_STATS_QUERY, args.repeat),
+                    "group_by_ms": measure(cur, CATEGORY_STATS_NAIVE_QUERY, args.repeat),
+                })
+            # Возвращаем таблицу в исходное состояние
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
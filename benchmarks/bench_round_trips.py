@@ -0,0 +1,162 @@
+"""Round trips до БД: последовательные запросы против pipeline mode и prepared statements.
+
+Запуск (нужна база со схемой приложения, настройки подключения - как у приложения):
+
+    python benchmarks/bench_round_trips.py --rtt 40 --iterations 50
+
+Между клиентом и PostgreSQL поднимается локальный TCP-прокси, который
+задерживает каждый пакет на rtt/2 в каждую сторону - так локальная база
+ведёт себя как удалённая (Railway). Каждый сценарий выполняется на одном
+соединении iterations раз, результат - p50/p95 по сценариям.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg.rows import dict_row
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import summarize  # noqa: E402
+from catalog import build_dishes_query  # noqa: E402
+from db import get_conninfo  # noqa: E402
+
+DB_INFO_QUERIES = [
+    "SELECT current_database() as db_name, current_user as db_user;",
+    "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' ORDER BY table_name;",
+    "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'dishes' "
+    "ORDER BY ordinal_position;",
+    "SELECT COUNT(*) as cnt FROM dishes;",
+]
+VERSION_QUERY = "SELECT version, updated_at FROM catalog_version WHERE id = 1;"
+
+
+class LatencyProxy:
+    """TCP-прокси, добавляющий задержку delay секунд в каждом направлении"""
+
+    def __init__(self, target_host, target_port, delay):
+        self.target_host = target_host
+        self.target_port = target_port
+        self.delay = delay
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(self.target_host, self.target_port)
+        await asyncio.gather(
+            self._pipe(client_reader, server_writer),
+            self._pipe(server_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    async def _pipe(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while data := await reader.read(65536):
+                # call_later с одинаковой задержкой сохраняет порядок пакетов
+                loop.call_later(self.delay, writer.write, data)
+        finally:
+            loop.call_later(self.delay, writer.close)
+
+
+async def db_info_sequential(conn):
+    async with conn.cursor() as cur:
+        for query in DB_INFO_QUERIES:
+            await cur.execute(query)
+            await cur.fetchall()
+
+
+async def db_info_pipeline(conn):
+    cursors = [conn.cursor() for _ in DB_INFO_QUERIES]
+    async with conn.pipeline():
+        for cur, query in zip(cursors, DB_INFO_QUERIES):
+            await cur.execute(query)
+    for cur in cursors:
+        await cur.fetchall()
+        await cur.close()
+
+
+def dishes_queries():
+    filters = dict.fromkeys(("category", "min_price", "max_price", "max_delivery_time", "min_rating"))
+    return [
+        build_dishes_query(filters, "rating", "desc", None, False, 51, numeric_as_float=True),
+        build_dishes_query(filters, "rating", "desc", None, True, 51, numeric_as_float=True),
+    ]
+
+
+async def dishes_sequential(conn):
+    async with conn.cursor() as cur:
+        for query, params in dishes_queries():
+            await cur.execute(query, params, prepare=False)
+            await cur.fetchall()
+
+
+async def dishes_pipeline_prepared(conn):
+    cursors = [conn.cursor(), conn.cursor()]
+    async with conn.pipeline():
+        for cur, (query, params) in zip(cursors, dishes_queries()):
+            await cur.execute(query, params, prepare=True)
+    for cur in cursors:
+        await cur.fetchall()
+        await cur.close()
+
+
+async def version_unprepared(conn):
+    await (await conn.execute(VERSION_QUERY, prepare=False)).fetchone()
+
+
+async def version_prepared(conn):
+    await (await conn.execute(VERSION_QUERY, prepare=True)).fetchone()
+
+
+SCENARIOS = [
+    ("db_info_sequential", db_info_sequential),
+    ("db_info_pipeline", db_info_pipeline),
+    ("dishes_two_phase_sequential", dishes_sequential),
+    ("dishes_two_phase_pipeline_prepared", dishes_pipeline_prepared),
+    ("catalog_version_unprepared", version_unprepared),
+    ("catalog_version_prepared", version_prepared),
+]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt", type=float, default=40, help="имитируемый RTT до БД, мс")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    conninfo = get_conninfo()
+    params = conninfo_to_dict(conninfo)
+    proxy = LatencyProxy(params.get("host", "localhost"), int(params.get("port", 5432)), args.rtt / 2000)
+    port = await proxy.start()
+    try:
+        proxied = make_conninfo(conninfo, host="127.0.0.1", port=port)
+        async with await psycopg.AsyncConnection.connect(proxied, autocommit=True, row_factory=dict_row) as conn:
+            for name, scenario in SCENARIOS:
+                # Прогрев: для prepared - подготовка запроса на сервере
+                await scenario(conn)
+                latencies = []
+                started = time.perf_counter()
+                for _ in range(args.iterations):
+                    one_started = time.perf_counter()
+                    await scenario(conn)
+                    latencies.append(time.perf_counter() - one_started)
+                print({"scenario": name, "rtt_ms": args.rtt,
+                       **summarize(latencies, time.perf_counter() - started)})
+    finally:
+        await proxy.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
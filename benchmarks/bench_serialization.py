@@ -0,0 +1,82 @@
+"""Микробенчмарк сериализации ответа /dishes: строк в секунду.
+
+Запуск (база не нужна, строки генерируются в памяти):
+
+    python benchmarks/bench_serialization.py --rows 10000
+
+Сравниваются:
+- fastapi_default: dict на строку + jsonable_encoder + json.dumps (как было);
+- orjson_dicts: dict на строку, Decimal через default, datetime нативно;
+- orjson_tuples: кортежи с float вместо Decimal (compact=true, numeric::float8).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import DISH_COLUMNS  # noqa: E402
+from responses import dumps  # noqa: E402
+
+
+def make_rows(count):
+    """Строки в том виде, в каком их отдаёт драйвер"""
+    created_at = datetime(2024, 1, 1, 12, 30, 15, 123456)
+    updated_at = datetime(2024, 1, 2, 9, 15, 0, 654321, tzinfo=timezone.utc)
+    return [
+        (i, f"Dish {i}", "Grilled chicken with vegetables", Decimal("12.99"), "Healthy", 24, Decimal("4.8"),
+         None, created_at, updated_at)
+        for i in range(1, count + 1)
+    ]
+
+
+def fastapi_default(rows):
+    dishes = [dict(zip(DISH_COLUMNS, row)) for row in rows]
+    return json.dumps(jsonable_encoder({"success": True, "dishes": dishes})).encode()
+
+
+def orjson_dicts(rows):
+    dishes = [dict(zip(DISH_COLUMNS, row)) for row in rows]
+    return dumps({"success": True, "dishes": dishes})
+
+
+def orjson_tuples(rows):
+    return dumps({"success": True, "columns": DISH_COLUMNS, "dishes": rows})
+
+
+def measure(func, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - started)
+    return round(len(rows) / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    # Для compact-режима драйвер уже отдаёт float (price::float8, rating::float8)
+    float_rows = [row[:3] + (float(row[3]),) + row[4:6] + (float(row[6]),) + row[7:] for row in rows]
+
+    results = {
+        "rows": args.rows,
+        "fastapi_default_rows_per_sec": measure(fastapi_default, rows, args.repeat),
+        "orjson_dicts_rows_per_sec": measure(orjson_dicts, rows, args.repeat),
+        "orjson_tuples_rows_per_sec": measure(orjson_tuples, float_rows, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
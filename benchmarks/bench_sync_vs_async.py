@@ -0,0 +1,88 @@
+"""Сравнение sync и async обработчиков /dishes.
+
+Запуск (нужны httpx и база с таблицей dishes, см. POST /add-100-dishes):
+
+    python benchmarks/bench_sync_vs_async.py --requests 2000 --concurrency 200
+
+Оба варианта выполняют один и тот же запрос к БД: sync-обработчик через
+ConnectionPool в threadpool, async-обработчик через AsyncConnectionPool.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import summarize  # noqa: E402
+from db import (  # noqa: E402
+    get_connection, open_pool, close_pool,
+    get_async_connection, open_async_pool, close_async_pool,
+)
+
+QUERY = "SELECT * FROM dishes ORDER BY id;"
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/sync/dishes")
+def sync_dishes():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(QUERY)
+            return {"dishes": cur.fetchall()}
+
+
+@bench_app.get("/async/dishes")
+async def async_dishes():
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(QUERY)
+            return {"dishes": await cur.fetchall()}
+
+
+async def run(client, path, total, concurrency):
+    """Выполнить total запросов к path не более чем concurrency одновременно"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    return {"path": path, "concurrency": concurrency, **summarize(latencies, elapsed)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    open_pool()
+    await open_async_pool()
+    try:
+        transport = httpx.ASGITransport(app=bench_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in ("/sync/dishes", "/async/dishes"):
+                # Прогрев пула
+                await run(client, path, 50, 10)
+                print(await run(client, path, args.requests, args.concurrency))
+    finally:
+        await close_async_pool()
+        close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
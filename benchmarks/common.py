@@ -0,0 +1,38 @@
+"""Общие части бенчмарков: генерация блюд и статистика по задержкам."""
+import math
+import statistics
+
+# N сгенерированных блюд одним INSERT ... SELECT (параметр - количество)
+GENERATE_DISHES = """
+    INSERT INTO dishes (name, description, price, category, delivery_time, rating)
+    SELECT 'Dish ' || n,
+           'Generated dish ' || n,
+           round((random() * 30 + 2)::numeric, 2),
+           (ARRAY ['Healthy', 'Fast Food', 'Pizza', 'Asian', 'Italian', 'Dessert', 'Mexican'])[1 + n % 7],
+           10 + n % 25,
+           round((3 + random() * 2)::numeric, 1)
+    FROM generate_series(1, %s) AS n;
+"""
+
+
+def percentile(sorted_values, p):
+    """Перцентиль p (0-100) по отсортированному списку (nearest-rank)"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Пропускная способность и перцентили задержек (в мс)"""
+    latencies = sorted(latencies)
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": to_ms(statistics.fmean(latencies)) if latencies else None,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+    }
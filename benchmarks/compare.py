@@ -0,0 +1,64 @@
+"""Сравнить два прогона benchmarks/run_suite.py и найти регрессии.
+
+    python benchmarks/compare.py base.json new.json --threshold 0.10
+
+Регрессия - падение rps или рост p50/p95/p99 больше чем на threshold
+(доля, 0.10 = 10%), либо появление ошибок. Код выхода 1, если регрессии есть.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def relative_change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return round((new - old) / old, 4)
+
+
+def compare(base, new, threshold):
+    scenarios = {}
+    regressions = []
+
+    for name, old in base["results"].items():
+        current = new["results"].get(name)
+        if current is None:
+            continue
+
+        changes = {"rps": relative_change(old["rps"], current["rps"])}
+        for key in LATENCY_KEYS:
+            changes[key] = relative_change(old[key], current[key])
+        scenarios[name] = changes
+
+        if changes["rps"] is not None and changes["rps"] < -threshold:
+            regressions.append(f"{name}: rps {old['rps']} -> {current['rps']}")
+        for key in LATENCY_KEYS:
+            if changes[key] is not None and changes[key] > threshold:
+                regressions.append(f"{name}: {key} {old[key]} -> {current[key]}")
+        if current["errors"] > old["errors"]:
+            regressions.append(f"{name}: errors {old['errors']} -> {current['errors']}")
+
+    return {"threshold": threshold, "scenarios": scenarios, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    result = compare(base, new, args.threshold)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
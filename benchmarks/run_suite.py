@@ -0,0 +1,270 @@
+"""Нагрузочный бенчмарк API на одноразовом локальном PostgreSQL.
+
+Запуск (нужны бинарники PostgreSQL - initdb/pg_ctl - и пакеты из
+benchmarks/requirements.txt; initdb не запускается от root):
+
+    python benchmarks/run_suite.py --dishes 100000 --concurrency 50 --output run.json
+
+Скрипт создаёт временный кластер PostgreSQL, поднимает uvicorn с main:app,
+заполняет dishes N строками и по очереди нагружает сценарии, затем всё
+останавливает и удаляет. Результат - JSON с rps и p50/p95/p99 по каждому
+сценарию; два таких файла сравнивает benchmarks/compare.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import psycopg
+
+from common import GENERATE_DISHES, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (имя, метод, путь). Сидирующие сценарии перезаписывают таблицу, поэтому идут последними.
+READ_SCENARIOS = [
+    ("dishes_first_page", "GET", "/dishes?limit=50"),
+    ("dishes_filtered_sorted", "GET", "/dishes?category=Pizza&sort=rating&order=desc&limit=50"),
+    ("dishes_compact_500", "GET", "/dishes?limit=500&compact=true"),
+    ("dishes_list_fields", "GET", "/dishes?fields=list&sort=rating&order=desc&limit=50"),
+    ("db_info", "GET", "/db-info"),
+]
+SEED_SCENARIOS = [
+    ("add_sample_dishes", "POST", "/add-sample-dishes"),
+    ("add_100_dishes", "POST", "/add-100-dishes"),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def find_pg_bin(pg_bin):
+    """Каталог с initdb/pg_ctl: --pg-bin, PATH или pg_config --bindir"""
+    if pg_bin:
+        return pg_bin
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        return subprocess.check_output([pg_config, "--bindir"], text=True).strip()
+    sys.exit("PostgreSQL binaries not found: install PostgreSQL or pass --pg-bin")
+
+
+class LocalPostgres:
+    """Одноразовый кластер PostgreSQL во временном каталоге"""
+
+    def __init__(self, pg_bin):
+        self.pg_bin = pg_bin
+        self.workdir = tempfile.mkdtemp(prefix="eatly-bench-pg-")
+        self.datadir = os.path.join(self.workdir, "data")
+        self.port = free_port()
+
+    def start(self):
+        subprocess.run(
+            [os.path.join(self.pg_bin, "initdb"), "-D", self.datadir, "-U", "bench", "--auth=trust",
+             "--encoding=UTF8", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        options = (f"-p {self.port} -k {self.workdir} -c listen_addresses=127.0.0.1 "
+                   f"-c fsync=off -c synchronous_commit=off -c max_connections=300")
+        subprocess.run(
+            [os.path.join(self.pg_bin, "pg_ctl"), "-D", self.datadir, "-o", options,
+             "-l", os.path.join(self.workdir, "postgres.log"), "-w", "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+
+    def stop(self):
+        subprocess.run(
+            [os.path.join(self.pg_bin, "pg_ctl"), "-D", self.datadir, "-m", "fast", "-w", "stop"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def env(self):
+        """Переменные окружения для db.get_conninfo() (локальная ветка, без SSL)"""
+        return {
+            "POSTGRES_DB": "postgres",
+            "POSTGRES_USER": "bench",
+            "POSTGRES_PASSWORD": "",
+            "POSTGRES_HOST": "127.0.0.1",
+            "POSTGRES_PORT": str(self.port),
+        }
+
+    def conninfo(self):
+        return f"host=127.0.0.1 port={self.port} user=bench dbname=postgres"
+
+
+class AppServer:
+    """uvicorn main:app в отдельном процессе"""
+
+    def __init__(self, env, workers):
+        self.port = free_port()
+        self.env = env
+        self.workers = workers
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT, env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                sys.exit("uvicorn exited during startup")
+            try:
+                if httpx.get(f"{self.url}/ping", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        sys.exit("uvicorn did not become ready in 60s")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+def seed(conninfo, dishes):
+    """Заполнить dishes N сгенерированными блюдами"""
+    with psycopg.connect(conninfo) as conn:
+        conn.execute("TRUNCATE dishes RESTART IDENTITY;")
+        conn.execute(GENERATE_DISHES, (dishes,))
+        conn.commit()
+        conn.autocommit = True
+        conn.execute("VACUUM ANALYZE dishes;")
+
+
+async def drive(client, method, path, concurrency, duration, warmup):
+    """Закрытый цикл: concurrency клиентов шлют запросы друг за другом duration секунд"""
+    latencies = []
+    errors = 0
+    measuring = False
+
+    async def worker(stop_at):
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if not measuring:
+                continue
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    if warmup > 0:
+        await asyncio.gather(*(worker(time.monotonic() + warmup) for _ in range(concurrency)))
+
+    measuring = True
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(time.monotonic() + duration) for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def run_scenarios(url, args):
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        for name, method, path in READ_SCENARIOS:
+            results[name] = await drive(client, method, path, args.concurrency, args.duration, args.warmup)
+            print(name, results[name], file=sys.stderr)
+
+        if not args.skip_seed_endpoints:
+            # Сиды делают TRUNCATE и блокируют друг друга - большая конкуренция тут бессмысленна
+            concurrency = min(args.concurrency, 4)
+            for name, method, path in SEED_SCENARIOS:
+                results[name] = await drive(client, method, path, concurrency, args.duration, 0)
+                print(name, results[name], file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=10000, help="сколько блюд сгенерировать (1k - 1M)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10, help="секунд на сценарий")
+    parser.add_argument("--warmup", type=float, default=2, help="секунд прогрева перед замером")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--no-cache", action="store_true", help="отключить кэш каталога в приложении")
+    parser.add_argument("--skip-seed-endpoints", action="store_true")
+    parser.add_argument("--pg-bin", help="каталог с initdb и pg_ctl")
+    parser.add_argument("--output", help="куда записать JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    postgres = LocalPostgres(find_pg_bin(args.pg_bin))
+    env = dict(os.environ)
+    env.pop("DATABASE_URL", None)
+    env.update(postgres.env())
+    if args.no_cache:
+        env["CATALOG_CACHE_TTL"] = "0"
+    server = AppServer(env, args.workers)
+
+    try:
+        postgres.start()
+        # Схему создают миграции при старте приложения
+        server.start()
+        seed(postgres.conninfo(), args.dishes)
+        results = asyncio.run(run_scenarios(server.url, args))
+    finally:
+        server.stop()
+        postgres.stop()
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dishes": args.dishes,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "cache": not args.no_cache,
+        },
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
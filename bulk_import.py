@@ -0,0 +1,229 @@
+import codecs
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from psycopg import sql
+from starlette.requests import ClientDisconnect
+
+
+# Колонки, которые можно загрузить; id и created_at заполняет база
+IMPORT_COLUMNS = ("name", "description", "price", "category", "delivery_time", "rating", "image_url")
+
+# Колонки в кортежах сид-данных (name, description, price, category, delivery_time, rating)
+SEED_COLUMNS = IMPORT_COLUMNS[:6]
+# Ключ advisory lock автозаполнения пустого каталога (свой, не ключ миграций)
+SEED_LOCK_ID = 72431002
+
+# Сколько ошибок разбора строк возвращаем клиенту (остальные только считаем)
+MAX_REPORTED_ERRORS = 100
+
+# Ограничения колонок dishes: значение вне них уронило бы COPY всей пачки
+MAX_LENGTHS = {"name": 255, "category": 100, "image_url": 500}
+# DECIMAL(10, 2) и DECIMAL(3, 1) - с учётом округления до scale
+MAX_PRICE = Decimal("99999999.995")
+MAX_RATING = Decimal("99.95")
+INT4_MIN, INT4_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+async def copy_dishes(cur, rows, columns=IMPORT_COLUMNS):
+    """Записать строки (кортежи в порядке columns) в dishes одним COPY FROM STDIN"""
+    query = sql.SQL("COPY dishes ({}) FROM STDIN").format(
+        sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+    )
+    async with cur.copy(query) as copy:
+        for row in rows:
+            await copy.write_row(row)
+
+
+async def iter_lines(chunks):
+    """Строки текста из потока байтов (UTF-8 может разрываться между чанками)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_csv_records(lines):
+    """(номер строки, dict) из CSV с заголовком. Поля в кавычках могут содержать переводы строк."""
+    header = None
+    pending = []
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        pending.append(line)
+        record = "\n".join(pending)
+        # Нечётное число кавычек - поле в кавычках продолжается на следующей строке
+        if record.count('"') % 2:
+            continue
+        pending = []
+        if not record.strip():
+            continue
+
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        yield line_number, dict(zip(header, values))
+
+    if pending:
+        yield line_number, ValueError("Unterminated quoted field")
+
+
+async def iter_ndjson_records(lines):
+    """(номер строки, dict) из NDJSON - по JSON-объекту на строку"""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, ValueError("Expected a JSON object")
+            continue
+        yield line_number, record
+
+
+def _optional(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def normalize_record(record):
+    """Проверить запись и привести её к кортежу в порядке IMPORT_COLUMNS"""
+    name = _optional(record.get("name"))
+    if name is None:
+        raise ValueError("'name' is required")
+
+    price = _optional(record.get("price"))
+    if price is None:
+        raise ValueError("'price' is required")
+    try:
+        price = Decimal(str(price))
+        rating = _optional(record.get("rating"))
+        rating = None if rating is None else Decimal(str(rating))
+    except InvalidOperation:
+        raise ValueError("'price' and 'rating' must be numbers")
+    if not price.is_finite() or price < 0:
+        raise ValueError("'price' must be a non-negative number")
+    if rating is not None and not rating.is_finite():
+        raise ValueError("'rating' must be a number")
+
+    delivery_time = _optional(record.get("delivery_time"))
+    if delivery_time is not None:
+        try:
+            delivery_time = int(delivery_time)
+        except (TypeError, ValueError):
+            raise ValueError("'delivery_time' must be an integer")
+
+        if not INT4_MIN <= delivery_time <= INT4_MAX:
+            raise ValueError("'delivery_time' is out of range")
+
+    if price >= MAX_PRICE:
+        raise ValueError("'price' must be less than 100000000")
+    if rating is not None and not -MAX_RATING < rating < MAX_RATING:
+        raise ValueError("'rating' must be between -99.9 and 99.9")
+
+    texts = {
+        "name": str(name),
+        "description": _optional(record.get("description")),
+        "category": _optional(record.get("category")),
+        "image_url": _optional(record.get("image_url")),
+    }
+    for column, value in texts.items():
+        if value is None:
+            continue
+        value = texts[column] = str(value)
+        if column in MAX_LENGTHS and len(value) > MAX_LENGTHS[column]:
+            raise ValueError(f"'{column}' must be at most {MAX_LENGTHS[column]} characters")
+        if "\x00" in value:
+            raise ValueError(f"'{column}' must not contain NUL characters")
+
+    return (
+        texts["name"],
+        texts["description"],
+        price,
+        texts["category"],
+        delivery_time,
+        rating,
+        texts["image_url"],
+    )
+
+
+async def import_dishes(conn, records, batch_size=5000):
+    """Загрузить записи пачками через COPY; каждая пачка - отдельная транзакция.
+
+    Ошибочная строка пропускается и попадает в errors, упавшая пачка
+    откатывается целиком и попадает в failed_batches - остальные загружаются.
+    Если поток оборвался (не UTF-8, клиент отключился), уже разобранные строки
+    загружаются, а причина попадает в aborted - отчёт о загруженном не теряется.
+    """
+    report = {
+        "imported": 0,
+        "batches": 0,
+        "failed_batches": [],
+        "errors": [],
+        "error_count": 0,
+        "aborted": None,
+    }
+
+    async def flush(batch, first_line, last_line):
+        report["batches"] += 1
+        try:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    await copy_dishes(cur, batch)
+        except Exception as e:
+            report["failed_batches"].append({
+                "batch": report["batches"],
+                "lines": [first_line, last_line],
+                "rows": len(batch),
+                "error": str(e),
+            })
+        else:
+            report["imported"] += len(batch)
+
+    batch = []
+    first_line = None
+    line_number = 0
+    try:
+        async for line_number, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                row = normalize_record(record)
+            except ValueError as e:
+                report["error_count"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": line_number, "error": str(e)})
+                continue
+
+            if not batch:
+                first_line = line_number
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await flush(batch, first_line, line_number)
+                batch = []
+    except UnicodeDecodeError as e:
+        report["aborted"] = {"after_line": line_number, "error": f"Invalid UTF-8: {e}"}
+    except ClientDisconnect:
+        report["aborted"] = {"after_line": line_number, "error": "Client disconnected"}
+
+    if batch:
+        await flush(batch, first_line, line_number)
+
+    return report
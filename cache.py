@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import psycopg
+
+from admission import serving_stale
+from db import get_conninfo, get_read_connection, pin_reads_to_primary, read_from_primary
+
+
+# Канал, в который триггер catalog_version шлёт уведомление об изменении каталога (см. migrations.py)
+CATALOG_CHANNEL = "catalog_changed"
+
+
+class CatalogCache:
+    """LRU-кэш результатов запросов каталога с TTL.
+
+    Одновременные промахи по одному ключу не идут в БД по отдельности:
+    первый запрос грузит данные, остальные ждут его результат.
+    """
+
+    def __init__(self, max_entries=256, ttl=60.0, dependents=()):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Кэши, которые сбрасываются вместе с этим (например, блюда по id)
+        self.dependents = dependents
+        self._entries = OrderedDict()
+        self._inflight = {}
+        # Увеличивается при каждой инвалидации: загрузки, начатые до неё, не попадают в кэш
+        self._generation = 0
+
+    def get(self, key):
+        """Значение из кэша или None, если его нет или оно устарело"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, generation, value = entry
+        if expires_at < time.monotonic() or generation != self._generation:
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def get_stale(self, key):
+        """Значение даже если оно устарело (по TTL или после инвалидации) - для сброса нагрузки"""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[2]
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, self._generation, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Сбросить все записи (вызывается при изменении каталога).
+
+        Сами записи остаются до вытеснения по LRU: при перегрузке их можно
+        отдать как устаревшие (см. admission.py).
+        """
+        self._generation += 1
+        for dependent in self.dependents:
+            dependent.clear()
+
+    async def get_or_load(self, key, loader):
+        """Вернуть значение из кэша или загрузить его через loader()"""
+        # Запрос с X-Read-Consistency: primary кэш не читает и не заполняет
+        if self.max_entries <= 0 or self.ttl <= 0 or read_from_primary.get():
+            return await loader()
+
+        value = self.get(key)
+        if value is None and serving_stale.get():
+            value = self.get_stale(key)
+        if value is not None:
+            return value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; если их нет - не ругаемся в лог
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if generation == self._generation:
+                self.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def get_many_or_load(self, keys, loader):
+        """Значения для нескольких ключей: что есть - из кэша, промахи - одним вызовом loader.
+
+        loader(missing_keys) возвращает {key: value}; ключей, которых нет в ответе,
+        нет и в результате (и в кэш они не попадают).
+        """
+        if self.max_entries <= 0 or self.ttl <= 0 or read_from_primary.get():
+            return await loader(list(keys))
+
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.get(key)
+            if value is None and serving_stale.get():
+                value = self.get_stale(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            generation = self._generation
+            loaded = await loader(missing)
+            if generation == self._generation:
+                for key, value in loaded.items():
+                    self.set(key, value)
+            found.update(loaded)
+        return found
+
+
+# Блюда по id для /dishes/batch - отдельно, чтобы не вытеснять страницы каталога
+dish_cache = CatalogCache(
+    max_entries=int(os.getenv("DISH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+)
+
+catalog_cache = CatalogCache(
+    max_entries=int(os.getenv("CATALOG_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+    dependents=(dish_cache,),
+)
+
+
+async def get_catalog_version():
+    """Текущая версия каталога: {"version", "updated_at"} или None, если схемы ещё нет.
+
+    Кэшируется вместе с данными и сбрасывается тем же NOTIFY, поэтому
+    условные запросы (304) обычно не ходят в БД вообще.
+    """
+    async def load():
+        # С того же сервера, что и данные: иначе ETag может оказаться новее тела ответа
+        async with get_read_connection() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    await cur.execute("SELECT version, updated_at FROM catalog_version WHERE id = 1;", prepare=True)
+                except psycopg.errors.UndefinedTable:
+                    await conn.rollback()
+                    return None
+                return await cur.fetchone()
+
+    return await catalog_cache.get_or_load(("catalog_version",), load)
+
+
+async def listen_catalog_changes():
+    """Слушать LISTEN catalog_changed и сбрасывать кэш (работает в фоне).
+
+    Так кэши всех воркеров uvicorn сбрасываются после записи в любом из них.
+    """
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(get_conninfo(), autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CATALOG_CHANNEL};")
+                # Пока не слушали, могли пропустить уведомления
+                pin_reads_to_primary()
+                catalog_cache.clear()
+                async for _ in conn.notifies():
+                    pin_reads_to_primary()
+                    catalog_cache.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Catalog listener error: {e}")
+            catalog_cache.clear()
+            await asyncio.sleep(5)
@@ -0,0 +1,377 @@
+import base64
+import binascii
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+from psycopg import sql
+
+
+# Колонки блюда, которые отдаёт API (служебные, например search_vector, не отдаём)
+DISH_COLUMNS = ("id", "name", "description", "price", "category", "delivery_time", "rating", "image_url",
+                "created_at", "updated_at")
+
+# Проекции для fields=: "list" - карточка в списке (её покрывают индексы dishes_list_*, см. migrations.py)
+FIELD_PRESETS = {
+    "list": ("id", "name", "price", "category", "delivery_time", "rating"),
+}
+
+# NUMERIC-колонки (в Python приходят как Decimal)
+NUMERIC_COLUMNS = ("price", "rating")
+
+# Колонки, по которым можно сортировать /dishes (id всегда добавляется для стабильности)
+SORT_COLUMNS = ("id", "rating", "price", "delivery_time")
+
+# Сколько блюд можно запросить за раз в /dishes/batch
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "500"))
+# dishes.id - SERIAL (int4)
+MAX_DISH_ID = 2 ** 31 - 1
+INT4_MIN, INT4_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Тип значения колонки сортировки в курсоре /dishes
+CURSOR_VALUE_TYPES = {"id": int, "delivery_time": int, "price": Decimal, "rating": Decimal}
+
+# Поиск: минимальная длина слова для поиска по префиксу и запроса для триграмм,
+# сколько совпадений максимум ранжировать при поиске по префиксу (typeahead)
+SEARCH_MIN_PREFIX = int(os.getenv("SEARCH_MIN_PREFIX", "3"))
+SEARCH_MIN_TRIGRAM = int(os.getenv("SEARCH_MIN_TRIGRAM", "3"))
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Статистика по категориям из category_stats (поддерживается триггерами, см. migrations.py)
+CATEGORY_STATS_QUERY = """
+    SELECT nullif(category, '')                                                   AS category,
+           dish_count,
+           price_min                                                              AS min_price,
+           round(price_sum / dish_count, 2)                                       AS avg_price,
+           price_max                                                              AS max_price,
+           round(rating_sum / nullif(rating_count, 0), 2)                         AS avg_rating,
+           round(delivery_time_sum::numeric / nullif(delivery_time_count, 0), 1) AS avg_delivery_time
+    FROM category_stats
+    ORDER BY category;
+"""
+
+# Тот же результат "в лоб" - GROUP BY по всей таблице (для сравнения в бенчмарке)
+CATEGORY_STATS_NAIVE_QUERY = """
+    SELECT category,
+           count(*)                         AS dish_count,
+           min(price)                       AS min_price,
+           round(avg(price), 2)             AS avg_price,
+           max(price)                       AS max_price,
+           round(avg(rating), 2)            AS avg_rating,
+           round(avg(delivery_time), 1)     AS avg_delivery_time
+    FROM dishes
+    GROUP BY category
+    ORDER BY category;
+"""
+
+
+class InvalidIds(ValueError):
+    """Некорректный список id для /dishes/batch"""
+
+
+def parse_ids(ids):
+    """Список id из "1,2,3" или из списка. Порядок сохраняется, повторы убираются."""
+    if isinstance(ids, str):
+        ids = [part for part in ids.split(",") if part.strip()]
+    try:
+        ids = [int(value) for value in ids]
+    except (TypeError, ValueError):
+        raise InvalidIds("ids must be a comma-separated list of integers")
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise InvalidIds("ids must not be empty")
+    if len(ids) > MAX_BATCH_IDS:
+        raise InvalidIds(f"Too many ids: {len(ids)} (max {MAX_BATCH_IDS})")
+    if not all(0 < value <= MAX_DISH_ID for value in ids):
+        raise InvalidIds("ids must be positive 32-bit integers")
+    return ids
+
+
+class InvalidFields(ValueError):
+    """Неизвестная колонка в fields="""
+
+
+def parse_fields(fields, sort="id"):
+    """Колонки для fields=name,price,... (или имя пресета, например fields=list).
+
+    id и колонка сортировки добавляются всегда - без них не построить курсор.
+    Порядок - как в DISH_COLUMNS, чтобы fields=price,name и fields=name,price
+    давали один и тот же запрос (и ключ кэша).
+    """
+    if fields is None:
+        return DISH_COLUMNS
+    if fields in FIELD_PRESETS:
+        requested = set(FIELD_PRESETS[fields])
+    else:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = requested - set(DISH_COLUMNS)
+        if unknown:
+            raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}. "
+                                f"Allowed: {', '.join(DISH_COLUMNS)} or a preset: {', '.join(FIELD_PRESETS)}")
+    requested |= {"id", sort}
+    return tuple(column for column in DISH_COLUMNS if column in requested)
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или не подходит к текущей сортировке"""
+
+
+def encode_cursor(sort, order, value, last_id):
+    """Курсор на строку: значение колонки сортировки + id"""
+    payload = {
+        "sort": sort,
+        "order": order,
+        "value": None if value is None else str(value),
+        "id": last_id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _parse_cursor_value(sort, value):
+    """Значение колонки сортировки из курсора - в тип колонки, иначе ошибка уйдёт в SQL"""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise InvalidCursor("Invalid cursor")
+    try:
+        value = CURSOR_VALUE_TYPES[sort](value)
+    except (ValueError, ArithmeticError):
+        raise InvalidCursor("Invalid cursor")
+    if isinstance(value, Decimal) and not value.is_finite():
+        raise InvalidCursor("Invalid cursor")
+    if isinstance(value, int) and not INT4_MIN <= value <= INT4_MAX:
+        raise InvalidCursor("Invalid cursor")
+    return value
+
+
+def decode_cursor(cursor, sort, order):
+    """Разобрать курсор и проверить, что он выдан для той же сортировки"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        last_id = int(payload["id"])
+        value = payload["value"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor("Invalid cursor")
+
+    if payload.get("sort") != sort or payload.get("order") != order:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    if not 0 <= last_id <= MAX_DISH_ID:
+        raise InvalidCursor("Invalid cursor")
+
+    return {"value": _parse_cursor_value(sort, value), "id": last_id}
+
+
+def merge_null_phase(dishes, null_dishes, limit):
+    """Дополнить выборку строками NULL-фазы: всего не больше limit + 1 (лишняя - признак has_more)"""
+    if len(dishes) <= limit:
+        dishes = dishes + null_dishes[:limit + 1 - len(dishes)]
+    return dishes
+
+
+def paginate(rows, limit, sort, order, columns=None):
+    """Выборка из limit + 1 строк -> (страница, курсор на следующую или None).
+
+    columns - порядок значений в строках-кортежах (compact=true), без него строки - dict.
+    Последняя строка с NULL в колонке сортировки даёт курсор в NULL-фазу.
+    """
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    if columns is not None:
+        value, last_id = last[columns.index(sort)], last[columns.index("id")]
+    else:
+        value, last_id = last[sort], last["id"]
+    return rows, encode_cursor(sort, order, value, last_id)
+
+
+# Граница выборки изменений: транзакции с xid ниже xmin снимка уже завершены
+CHANGES_BOUND_QUERY = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS xmin;"
+
+
+def encode_changes_cursor(xid, last_id):
+    """Курсор /dishes/changes: позиция (change_xid, id), до которой клиент уже синхронизирован"""
+    raw = json.dumps({"xid": str(xid), "id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_changes_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        xid = int(payload["xid"])
+        last_id = int(payload["id"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor("Invalid cursor")
+    if xid < 0 or last_id < 0:
+        raise InvalidCursor("Invalid cursor")
+    return xid, last_id
+
+
+def build_changes_queries(xid, last_id, limit, columns=DISH_COLUMNS):
+    """Изменённые блюда и надгробия после позиции (xid, id), по limit строк из каждой таблицы.
+
+    Оба запроса - range scan по индексам (change_xid, id).
+    """
+    position = sql.SQL("(change_xid, id) > (%s::text::xid8, %s) ORDER BY change_xid, id LIMIT %s")
+    params = [str(xid), last_id, limit]
+    upserts = sql.SQL("SELECT change_xid::text AS change_position, {columns} FROM dishes WHERE {position}").format(
+        columns=select_columns(columns, numeric_as_float=True), position=position,
+    )
+    deletes = sql.SQL("SELECT change_xid::text AS change_position, id FROM dish_tombstones WHERE {position}").format(
+        position=position,
+    )
+    return (upserts, params), (deletes, params)
+
+
+def select_columns(columns=DISH_COLUMNS, numeric_as_float=False):
+    """Список колонок для SELECT.
+
+    numeric_as_float=True отдаёт NUMERIC-колонки как float8: драйвер не создаёт
+    Decimal на каждое значение, а JSON получается тот же (Decimal и так уходит числом).
+    """
+    if not numeric_as_float:
+        return sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+
+    return sql.SQL(", ").join(
+        sql.SQL("{}::float8 AS {}").format(sql.Identifier("dishes", column), sql.Identifier(column))
+        if column in NUMERIC_COLUMNS else sql.Identifier(column)
+        for column in columns
+    )
+
+
+def build_dishes_query(filters, sort="id", order="asc", after=None, nulls=False, limit=50,
+                       numeric_as_float=False, columns=DISH_COLUMNS):
+    """Собрать SELECT для одной страницы каталога.
+
+    Строки с NULL в колонке сортировки отдаются после всех остальных
+    отдельной "фазой" (nulls=True): так обе фазы остаются range scan по
+    индексу (col, id) без OR в условии. columns - проекция (см. parse_fields).
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort}")
+
+    direction = sql.SQL("DESC") if order == "desc" else sql.SQL("ASC")
+    compare = sql.SQL("<") if order == "desc" else sql.SQL(">")
+    # С именем таблицы: в ORDER BY иначе подставится выходная колонка (float8) и индекс не сработает
+    column = sql.Identifier("dishes", sort)
+
+    conditions = []
+    params = []
+
+    if filters.get("category") is not None:
+        conditions.append(sql.SQL("category = %s"))
+        params.append(filters["category"])
+    if filters.get("min_price") is not None:
+        conditions.append(sql.SQL("price >= %s"))
+        params.append(filters["min_price"])
+    if filters.get("max_price") is not None:
+        conditions.append(sql.SQL("price <= %s"))
+        params.append(filters["max_price"])
+    if filters.get("max_delivery_time") is not None:
+        conditions.append(sql.SQL("delivery_time <= %s"))
+        params.append(filters["max_delivery_time"])
+    if filters.get("min_rating") is not None:
+        conditions.append(sql.SQL("rating >= %s"))
+        params.append(filters["min_rating"])
+
+    if sort == "id":
+        order_by = sql.SQL("id {}").format(direction)
+        if after is not None:
+            conditions.append(sql.SQL("id {} %s").format(compare))
+            params.append(after["id"])
+    elif nulls:
+        # Фаза NULL: значение колонки одинаковое, порядок задаёт только id
+        conditions.append(sql.SQL("{} IS NULL").format(column))
+        order_by = sql.SQL("id {}").format(direction)
+        if after is not None:
+            conditions.append(sql.SQL("id {} %s").format(compare))
+            params.append(after["id"])
+    else:
+        conditions.append(sql.SQL("{} IS NOT NULL").format(column))
+        order_by = sql.SQL("{col} {dir}, id {dir}").format(col=column, dir=direction)
+        if after is not None:
+            conditions.append(sql.SQL("({}, id) {} (%s, %s)").format(column, compare))
+            params.extend([after["value"], after["id"]])
+
+    where = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    query = sql.SQL("SELECT {columns} FROM dishes {where} ORDER BY {order_by}").format(
+        columns=select_columns(columns, numeric_as_float), where=where, order_by=order_by
+    )
+    # limit=None - без ограничения (потоковая выгрузка)
+    if limit is not None:
+        query += sql.SQL(" LIMIT %s")
+        params.append(limit)
+    return query, params
+
+
+def build_batch_query(ids):
+    """Блюда по списку id одним запросом (id = ANY(массив) - поиск по первичному ключу)"""
+    query = sql.SQL("SELECT {columns} FROM dishes WHERE id = ANY(%s)").format(
+        columns=select_columns(numeric_as_float=True),
+    )
+    return query, [list(ids)]
+
+
+def to_prefix_tsquery(text):
+    """Текст поиска -> tsquery для typeahead: по префиксу ищется только последнее
+    (недописанное) слово и только от SEARCH_MIN_PREFIX символов - иначе "c:*"
+    совпадает с большей частью таблицы.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if words and len(words[-1]) >= SEARCH_MIN_PREFIX:
+        words[-1] += ":*"
+    return " & ".join(words)
+
+
+def build_search_query(text, category=None, limit=20):
+    """Полнотекстовый поиск по name/description + триграммы по name для опечаток.
+
+    Оба условия обслуживаются GIN-индексами (search_vector и name gin_trgm_ops),
+    релевантность - сумма ts_rank и word_similarity. Для коротких запросов
+    триграммы не используются.
+
+    Запрос с недописанным словом (typeahead, "chi:*") совпадает с большой частью
+    таблицы, поэтому ранжируются не все совпадения, а до SEARCH_MAX_CANDIDATES
+    любых плюс столько же ближайших по названию (KNN по GiST-индексу name
+    gist_trgm_ops) - точное совпадение названия в выборку попадает всегда.
+    """
+    tsquery = to_prefix_tsquery(text)
+    match = sql.SQL("search_vector @@ query")
+    if len(text) >= SEARCH_MIN_TRIGRAM:
+        match = sql.SQL("(search_vector @@ query OR %(text)s <%% name)")
+    conditions = [match]
+    params = {"text": text, "tsquery": tsquery, "limit": limit}
+
+    if category is not None:
+        conditions.append(sql.SQL("category = %(category)s"))
+        params["category"] = category
+
+    source = sql.SQL("dishes, to_tsquery('english', %(tsquery)s) AS query")
+    where = sql.SQL(" AND ").join(conditions)
+    if tsquery.endswith(":*"):
+        where = sql.SQL("""id IN (
+            (SELECT id FROM {source} WHERE {where} LIMIT %(candidates)s)
+            UNION
+            (SELECT id FROM {source} WHERE {where} ORDER BY %(text)s <<-> name LIMIT %(candidates)s)
+        )""").format(source=source, where=where)
+        params["candidates"] = SEARCH_MAX_CANDIDATES
+
+    query = sql.SQL("""
+        SELECT {columns},
+               ts_rank(search_vector, query) + word_similarity(%(text)s, name) AS score
+        FROM {source}
+        WHERE {where}
+        ORDER BY score DESC, id
+        LIMIT %(limit)s
+    """).format(
+        columns=select_columns(),
+        source=source,
+        where=where,
+    )
+    return query, params
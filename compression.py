@@ -0,0 +1,189 @@
+import gzip
+import os
+import zlib
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+
+# Ответы меньше этого размера не сжимаем - выигрыш меньше накладных расходов
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Уровни сжатия: "на лету" - быстро, для кэшируемых ответов - сильнее (сжимаются один раз)
+DYNAMIC_LEVELS = {"br": 4, "gzip": 6}
+CACHED_LEVELS = {"br": 9, "gzip": 9}
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def choose_encoding(accept_encoding):
+    """Выбрать br или gzip по Accept-Encoding (с учётом q). None - без сжатия."""
+    preferences = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        preferences[name] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in ("br", "gzip"):
+        quality = preferences.get(encoding, preferences.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def add_vary(headers, value):
+    """Добавить значение в Vary, если его там ещё нет (add_vary_header его дублирует)"""
+    vary = headers.get("vary")
+    if vary is None:
+        headers["Vary"] = value
+    elif value.lower() not in {item.strip().lower() for item in vary.split(",")}:
+        headers["Vary"] = f"{vary}, {value}"
+
+
+def compress(body, encoding, levels=DYNAMIC_LEVELS):
+    if encoding == "br":
+        return brotli.compress(body, quality=levels["br"])
+    return gzip.compress(body, compresslevel=levels["gzip"], mtime=0)
+
+
+class CachedBody:
+    """Готовое тело ответа и его сжатые варианты (сжимаются один раз, при первом запросе)"""
+
+    __slots__ = ("identity", "_encoded")
+
+    def __init__(self, identity):
+        self.identity = identity
+        self._encoded = {}
+
+    def content_encoding(self, encoding):
+        """Content-Encoding, с которым тело будет отдано (маленькие тела не сжимаются)"""
+        if encoding is None or len(self.identity) < MINIMUM_SIZE:
+            return None
+        return encoding
+
+    def get(self, encoding):
+        """(тело, Content-Encoding или None) для выбранного кодирования"""
+        if self.content_encoding(encoding) is None:
+            return self.identity, None
+
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.identity, encoding, CACHED_LEVELS)
+        return body, encoding
+
+
+class _StreamCompressor:
+    """Потоковое сжатие: каждый чанк сразу выталкивается клиенту (flush)"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=DYNAMIC_LEVELS["br"])
+        else:
+            self._compressor = zlib.compressobj(DYNAMIC_LEVELS["gzip"], zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """gzip/brotli для всех ответов, которые ещё не сжаты (Content-Encoding не задан)"""
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough, compressor
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Заголовки отправим, когда увидим первый кусок тела
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                add_vary(headers, "Accept-Encoding")
+
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    passthrough = True
+                    await send(message)
+                    return
+
+                headers["Content-Encoding"] = encoding
+                # Сжатое тело - другое представление: сильный ETag становится слабым
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+
+                if not more_body:
+                    body = compress(body, encoding)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                del headers["Content-Length"]
+                compressor = _StreamCompressor(encoding)
+                await send(start_message)
+                start_message = None
+
+            if more_body:
+                await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.chunk(body) + compressor.finish()})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,400 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+from starlette.datastructures import Headers
+
+from admission import Overloaded, serving_stale
+from metrics import (
+    DB_CONNECTION_ACQUIRE, DB_REPLICA_IN_USE, DB_REPLICA_LAG,
+    TimedAsyncConnection, TimedAsyncCursor, TimedConnection, TimedCursor,
+)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+_replica_pool = None
+_replica_pool_lock = asyncio.Lock()
+
+# Реплика используется, только если последняя проверка лага прошла успешно
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "2"))
+REPLICA_ACQUIRE_TIMEOUT = float(os.getenv("REPLICA_ACQUIRE_TIMEOUT", "1"))
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        -- Всё полученное уже применено: реплика догнала primary, даже если записей давно не было
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag;
+"""
+
+_replica_state = {"healthy": False, "lag": None, "primary_until": 0.0}
+
+# Бюджет соединений к БД на все воркеры uvicorn (у PostgreSQL по умолчанию max_connections=100,
+# запас - миграциям и psql). Каждый воркер берёт долю DB_MAX_CONNECTIONS / WEB_CONCURRENCY.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+DB_REPLICA_MAX_CONNECTIONS = int(os.getenv("DB_REPLICA_MAX_CONNECTIONS", str(DB_MAX_CONNECTIONS)))
+# Синхронный пул обслуживает только /test-connection и /test-db (app.py)
+SYNC_POOL_MAX_SIZE = 2
+# Кроме пулов воркер держит соединение LISTEN (cache.py)
+LISTEN_CONNECTIONS = 1
+
+# Запрос требует читать с primary (read-your-writes) - см. ReadConsistencyMiddleware
+read_from_primary = ContextVar("read_from_primary", default=False)
+
+
+def with_sslmode(database_url):
+    """Добавить sslmode=require (для Railway), если он не задан в URL"""
+    if "sslmode" not in database_url:
+        if "?" in database_url:
+            database_url += "&sslmode=require"
+        else:
+            database_url += "?sslmode=require"
+    return database_url
+
+
+def get_conninfo():
+    """Строка подключения к PostgreSQL"""
+    database_url = os.getenv("DATABASE_URL")
+
+    if database_url:
+        return with_sslmode(database_url)
+
+    # Локальная разработка
+    return make_conninfo(
+        dbname=os.getenv("POSTGRES_DB", "EatlyServer"),
+        user=os.getenv("POSTGRES_USER", "shahzod"),
+        password=os.getenv("POSTGRES_PASSWORD", "2008"),
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=os.getenv("POSTGRES_PORT", "5432"),
+    )
+
+
+def worker_connection_budget(total=DB_MAX_CONNECTIONS):
+    """Сколько соединений может открыть один воркер (WEB_CONCURRENCY задаёт serve.py)"""
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+    return max(1, total // workers)
+
+
+def get_pool_settings(prefix="DB_POOL", default_max_size=10):
+    """Настройки пула из переменных окружения"""
+    max_size = int(os.getenv(f"{prefix}_MAX_SIZE", str(default_max_size)))
+    return {
+        "min_size": min(int(os.getenv(f"{prefix}_MIN_SIZE", "1")), max_size),
+        "max_size": max_size,
+        "timeout": float(os.getenv(f"{prefix}_TIMEOUT", "30")),
+        "max_idle": float(os.getenv(f"{prefix}_MAX_IDLE", "300")),
+        "max_lifetime": float(os.getenv(f"{prefix}_MAX_LIFETIME", "3600")),
+    }
+
+
+def get_prepare_threshold():
+    """После скольких выполнений запрос готовится на сервере (prepared statement).
+
+    Горячие запросы готовятся сразу (execute(..., prepare=True)). За PgBouncer
+    в режиме transaction prepared statements не работают - тогда DB_PREPARE_THRESHOLD=off.
+    """
+    value = os.getenv("DB_PREPARE_THRESHOLD", "5")
+    if value.lower() in ("off", "none", ""):
+        return None
+    return int(value)
+
+
+def create_pool():
+    """Создать пул подключений (настройки берутся из переменных окружения)"""
+    conninfo = get_conninfo()
+    print(f"Connecting to: {conninfo[:60]}...")
+
+    return ConnectionPool(
+        conninfo,
+        connection_class=TimedConnection,
+        kwargs={
+            "row_factory": dict_row,
+            "cursor_factory": TimedCursor,
+            "prepare_threshold": get_prepare_threshold(),
+        },
+        # Проверяем соединение перед выдачей, чтобы не отдать "мёртвое"
+        check=ConnectionPool.check_connection,
+        name="eatly",
+        open=False,
+        **get_pool_settings(default_max_size=SYNC_POOL_MAX_SIZE),
+    )
+
+
+def create_async_pool():
+    """Асинхронный пул для async-эндпоинтов (настройки DB_ASYNC_POOL_*)"""
+    return AsyncConnectionPool(
+        get_conninfo(),
+        connection_class=TimedAsyncConnection,
+        kwargs={
+            "row_factory": dict_row,
+            "cursor_factory": TimedAsyncCursor,
+            "prepare_threshold": get_prepare_threshold(),
+        },
+        check=AsyncConnectionPool.check_connection,
+        name="eatly-async",
+        open=False,
+        # Остаток доли воркера после синхронного пула и LISTEN, но не больше прежних 10
+        **get_pool_settings(
+            "DB_ASYNC_POOL",
+            min(10, max(1, worker_connection_budget() - SYNC_POOL_MAX_SIZE - LISTEN_CONNECTIONS)),
+        ),
+    )
+
+
+def open_pool():
+    """Открыть пул (лениво, при первом обращении - см. get_pool)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool()
+            _pool.open()
+        return _pool
+
+
+def close_pool():
+    """Дождаться возврата соединений и закрыть пул"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close(timeout=float(os.getenv("DB_POOL_CLOSE_TIMEOUT", "10")))
+            _pool = None
+
+
+def get_pool():
+    """Текущий пул. Открывается лениво: он нужен только тестовым эндпоинтам."""
+    if _pool is None:
+        return open_pool()
+    return _pool
+
+
+def check_admission():
+    """Запрос в режиме "только кэш" (перегрузка, см. admission.py) в БД не ходит"""
+    if serving_stale.get():
+        raise Overloaded("cache_only")
+
+
+@contextmanager
+def get_connection():
+    """Взять подключение из пула (используется как контекстный менеджер)"""
+    check_admission()
+    started = time.perf_counter()
+    with get_pool().connection() as conn:
+        DB_CONNECTION_ACQUIRE.labels("sync").observe(time.perf_counter() - started)
+        yield conn
+
+
+async def open_async_pool():
+    """Открыть асинхронный пул (вызывается при старте приложения)"""
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is None:
+            _async_pool = create_async_pool()
+            await _async_pool.open()
+        return _async_pool
+
+
+async def close_async_pool():
+    """Дождаться возврата соединений и закрыть асинхронный пул"""
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            await _async_pool.close(timeout=float(os.getenv("DB_POOL_CLOSE_TIMEOUT", "10")))
+            _async_pool = None
+
+
+async def get_async_pool():
+    """Текущий асинхронный пул (открываем лениво, если нужно)"""
+    if _async_pool is None:
+        return await open_async_pool()
+    return _async_pool
+
+
+@asynccontextmanager
+async def get_async_connection():
+    """Взять асинхронное подключение из пула"""
+    check_admission()
+    started = time.perf_counter()
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        DB_CONNECTION_ACQUIRE.labels("async").observe(time.perf_counter() - started)
+        yield conn
+
+
+async def warm_pools(timeout):
+    """Дождаться, пока пулы откроют min_size соединений (TCP + TLS + auth до первого запроса).
+
+    Реплика необязательна: если она не отвечает, чтения и так пойдут на primary.
+    """
+    if _pool is not None:
+        await asyncio.to_thread(_pool.wait, timeout)
+    if _async_pool is not None:
+        await _async_pool.wait(timeout)
+    if _replica_pool is not None:
+        try:
+            await _replica_pool.wait(timeout)
+        except PoolTimeout as e:
+            print(f"⚠️ Replica pool warmup failed: {e}")
+
+
+def get_replica_conninfo():
+    """Строка подключения к реплике (DATABASE_REPLICA_URL) или None"""
+    database_url = os.getenv("DATABASE_REPLICA_URL")
+    return with_sslmode(database_url) if database_url else None
+
+
+def create_replica_pool(conninfo):
+    """Асинхронный пул реплики для читающих эндпоинтов (настройки DB_REPLICA_POOL_*)"""
+    return AsyncConnectionPool(
+        conninfo,
+        connection_class=TimedAsyncConnection,
+        kwargs={
+            "row_factory": dict_row,
+            "cursor_factory": TimedAsyncCursor,
+            "prepare_threshold": get_prepare_threshold(),
+        },
+        check=AsyncConnectionPool.check_connection,
+        name="eatly-replica",
+        open=False,
+        **get_pool_settings("DB_REPLICA_POOL", min(10, worker_connection_budget(DB_REPLICA_MAX_CONNECTIONS))),
+    )
+
+
+async def open_replica_pool():
+    """Открыть пул реплики, если она настроена. Недоступная реплика не мешает старту."""
+    global _replica_pool
+    conninfo = get_replica_conninfo()
+    if conninfo is None:
+        return None
+    async with _replica_pool_lock:
+        if _replica_pool is None:
+            _replica_pool = create_replica_pool(conninfo)
+            await _replica_pool.open()
+        return _replica_pool
+
+
+async def close_replica_pool():
+    global _replica_pool
+    async with _replica_pool_lock:
+        if _replica_pool is not None:
+            await _replica_pool.close(timeout=float(os.getenv("DB_POOL_CLOSE_TIMEOUT", "10")))
+            _replica_pool = None
+            _set_replica_state(False, None)
+
+
+def _set_replica_state(healthy, lag):
+    if healthy != _replica_state["healthy"]:
+        print(f"{'✅' if healthy else '⚠️'} Replica {'enabled' if healthy else 'disabled'} (lag: {lag})")
+    _replica_state["healthy"] = healthy
+    _replica_state["lag"] = lag
+    DB_REPLICA_IN_USE.set(1 if healthy else 0)
+    if lag is not None:
+        DB_REPLICA_LAG.set(lag)
+
+
+async def monitor_replica_lag():
+    """Проверять лаг реплики каждые REPLICA_CHECK_INTERVAL секунд (работает в фоне).
+
+    Если лаг больше REPLICA_MAX_LAG или реплика недоступна - чтения идут на primary.
+    """
+    while True:
+        try:
+            async with _replica_pool.connection(timeout=REPLICA_ACQUIRE_TIMEOUT) as conn:
+                cur = await conn.execute(REPLICA_LAG_QUERY)
+                lag = (await cur.fetchone())["lag"]
+            lag = None if lag is None else float(lag)
+            _set_replica_state(lag is not None and lag <= REPLICA_MAX_LAG, lag)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _replica_state["healthy"]:
+                print(f"Replica check error: {e}")
+            _set_replica_state(False, None)
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+
+def pin_reads_to_primary(seconds=REPLICA_MAX_LAG):
+    """После записи читать с primary, пока реплика гарантированно не догонит.
+
+    Иначе сброшенный кэш каталога снова заполнится старыми данными с реплики.
+    """
+    _replica_state["primary_until"] = max(_replica_state["primary_until"], time.monotonic() + seconds)
+
+
+def replica_available():
+    return (
+        _replica_pool is not None
+        and _replica_state["healthy"]
+        and time.monotonic() >= _replica_state["primary_until"]
+    )
+
+
+@asynccontextmanager
+async def get_read_connection():
+    """Подключение для читающих эндпоинтов: реплика, если она в порядке, иначе primary"""
+    check_admission()
+    if replica_available() and not read_from_primary.get():
+        started = time.perf_counter()
+        try:
+            conn = await _replica_pool.getconn(timeout=REPLICA_ACQUIRE_TIMEOUT)
+        except (PoolTimeout, psycopg.OperationalError) as e:
+            # Реплика перегружена или недоступна - этот запрос обслужит primary
+            print(f"Replica unavailable, reading from primary: {e}")
+        else:
+            DB_CONNECTION_ACQUIRE.labels("replica").observe(time.perf_counter() - started)
+            try:
+                # Как pool.connection(): COMMIT/ROLLBACK до возврата в пул, иначе пул
+                # откатывает транзакцию сам, а rollback() сбрасывает prepared statements
+                async with conn:
+                    yield conn
+            finally:
+                await _replica_pool.putconn(conn)
+            return
+
+    async with get_async_connection() as conn:
+        yield conn
+
+
+class ReadConsistencyMiddleware:
+    """X-Read-Consistency: primary - читать с primary в обход реплики и кэша каталога.
+
+    Нужен клиенту сразу после записи (read-your-writes).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Headers(scope=scope).get("x-read-consistency") != "primary":
+            await self.app(scope, receive, send)
+            return
+
+        token = read_from_primary.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            read_from_primary.reset(token)
+
+
+def get_open_pools():
+    """Открытые пулы по именам (для метрик)"""
+    pools = {}
+    if _pool is not None:
+        pools["sync"] = _pool
+    if _async_pool is not None:
+        pools["async"] = _async_pool
+    if _replica_pool is not None:
+        pools["replica"] = _replica_pool
+    return pools
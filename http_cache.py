@@ -0,0 +1,80 @@
+import os
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi.responses import Response
+
+
+# Заголовок для клиентов и CDN перед Railway: браузер всегда перепроверяет (дёшево, 304),
+# CDN может отдавать копию s-maxage секунд и ещё немного - пока обновляет её в фоне
+CATALOG_CACHE_CONTROL = os.getenv(
+    "CATALOG_CACHE_CONTROL",
+    "public, max-age=0, s-maxage=30, stale-while-revalidate=60",
+)
+
+
+def catalog_etag(version, encoding=None):
+    """Сильный ETag из версии каталога (без хеширования тела ответа).
+    У сжатых вариантов свой ETag - это разные представления."""
+    if encoding:
+        return f'"catalog-{version["version"]}-{encoding}"'
+    return f'"catalog-{version["version"]}"'
+
+
+def catalog_headers(version, encoding=None):
+    """ETag, Last-Modified и Cache-Control для ответа каталога"""
+    updated_at = version["updated_at"].astimezone(timezone.utc)
+    return {
+        "ETag": catalog_etag(version, encoding),
+        "Last-Modified": format_datetime(updated_at, usegmt=True),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+
+
+def _matching_etag(request, version, encoding=None):
+    """ETag из If-None-Match, совпавший с текущей версией, "*" или None.
+
+    Подходит и ETag без суффикса кодирования: маленькие тела отдаются несжатыми.
+    """
+    etags = {catalog_etag(version, encoding), catalog_etag(version)}
+    for candidate in request.headers.get("if-none-match", "").split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate in etags:
+            return candidate
+    return None
+
+
+def is_not_modified(request, version, encoding=None):
+    """Можно ли ответить 304 на условный запрос (If-None-Match важнее If-Modified-Since)"""
+    if request.headers.get("if-none-match") is not None:
+        return _matching_etag(request, version, encoding) is not None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP-даты с точностью до секунды
+        updated_at = version["updated_at"].astimezone(timezone.utc).replace(microsecond=0)
+        return updated_at <= since
+
+    return False
+
+
+def not_modified_response(request, version, encoding=None, cached=None):
+    """304 с тем же ETag, что был бы у ответа 200.
+
+    Маленькие тела отдаются несжатыми и с ETag без суффикса кодирования: кодирование
+    берём из закэшированного тела (CachedBody), а без него - из совпавшего If-None-Match.
+    """
+    if cached is not None:
+        encoding = cached.content_encoding(encoding)
+    elif _matching_etag(request, version, encoding) == catalog_etag(version):
+        encoding = None
+    return Response(status_code=304, headers=catalog_headers(version, encoding))
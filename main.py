@@ -1,49 +1,103 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
-import os
 import psycopg
-from psycopg.rows import dict_row
+from psycopg.rows import dict_row, tuple_row
+import os
 
 load_dotenv()
 
-app = FastAPI()
-
+# Локальные модули читают настройки из окружения при импорте - после load_dotenv
+from catalog import (  # noqa: E402
+    CATEGORY_STATS_QUERY, CHANGES_BOUND_QUERY, InvalidCursor, InvalidFields, InvalidIds, build_batch_query,
+    build_changes_queries, build_dishes_query, build_search_query, decode_changes_cursor, decode_cursor,
+    encode_changes_cursor, merge_null_phase, paginate, parse_fields, parse_ids,
+)
+from cache import catalog_cache, dish_cache, get_catalog_version, listen_catalog_changes  # noqa: E402
+from bulk_import import (  # noqa: E402
+    SEED_COLUMNS, SEED_LOCK_ID, copy_dishes, import_dishes, iter_csv_records, iter_lines, iter_ndjson_records,
+)
+from compression import CachedBody, CompressionMiddleware, choose_encoding  # noqa: E402
+from responses import FastJSONResponse, cached_json_response, dumps, to_ndjson  # noqa: E402
+from migrations import migrations_enabled, run_migrations  # noqa: E402
+from http_cache import catalog_headers, is_not_modified, not_modified_response  # noqa: E402
+from db import (  # noqa: E402
+    get_connection, close_pool,
+    get_async_connection, open_async_pool, close_async_pool, get_open_pools,
+    get_read_connection, open_replica_pool, close_replica_pool, monitor_replica_lag, ReadConsistencyMiddleware,
+)
+from admission import AdmissionMiddleware  # noqa: E402
+from warmup import warm_up  # noqa: E402
+from metrics import (  # noqa: E402
+    MetricsMiddleware, PoolStatsCollector, export_pool_stats, multiprocess_enabled, render_metrics, timed_pipeline,
+)
+from tracing import QueryTraceMiddleware  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """При старте применяем миграции, открываем и прогреваем пулы, при остановке закрываем.
+
+    uvicorn начинает принимать запросы воркером только после старта lifespan,
+    поэтому первые запросы после деплоя не платят за подключение к БД и пустой кэш.
+    """
+    app.state.ready = False
+    if migrations_enabled():
+        await run_migrations()
+    # Синхронный пул открывается лениво (см. db.get_pool) - в каждом воркере он обычно не нужен
+    await open_async_pool()
+    background = [asyncio.create_task(listen_catalog_changes())]
+    # Реплика для чтения (DATABASE_REPLICA_URL) - если настроена
+    if await open_replica_pool() is not None:
+        background.append(asyncio.create_task(monitor_replica_lag()))
+    # Несколько воркеров: статистику пулов каждого пишем в общий каталог метрик
+    if multiprocess_enabled():
+        background.append(asyncio.create_task(export_pool_stats(get_open_pools)))
+    await warm_up(app)
+    app.state.ready = True
+    yield
+    # Воркер останавливается: балансировщик должен перестать слать сюда запросы
+    app.state.ready = False
+    for task in background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await close_replica_pool()
+    await close_async_pool()
+    close_pool()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Внутри сжатия: Server-Timing считает время до начала ответа без учёта компрессии
+app.add_middleware(QueryTraceMiddleware)
+app.add_middleware(ReadConsistencyMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Ограничение одновременных запросов к БД; /ping, /health и т.п. не затрагиваются
+app.add_middleware(AdmissionMiddleware)
+# Снаружи admission: ответ 503 при перегрузке тоже получает CORS-заголовки, и браузер его прочитает
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Load-Shedding"],
 )
+# Последним - значит снаружи: в задержку входит и сжатие
+app.add_middleware(MetricsMiddleware)
 
+REGISTRY.register(PoolStatsCollector(get_open_pools))
 
-
-
-def get_connection():
-    """Подключение к PostgreSQL"""
-    database_url = os.getenv("DATABASE_URL")
-
-    if database_url:
-        # Добавляем SSL для Railway
-        if "sslmode" not in database_url:
-            if "?" in database_url:
-                database_url += "&sslmode=require"
-            else:
-                database_url += "?sslmode=require"
-
-        print(f"Connecting to: {database_url[:60]}...")
-        return psycopg.connect(database_url, row_factory=dict_row)
-    else:
-        # Локальная разработка
-        return psycopg.connect(
-            dbname=os.getenv("POSTGRES_DB", "EatlyServer"),
-            user=os.getenv("POSTGRES_USER", "shahzod"),
-            password=os.getenv("POSTGRES_PASSWORD", "2008"),
-            host=os.getenv("POSTGRES_HOST", "localhost"),
-            port=os.getenv("POSTGRES_PORT", "5432"),
-            row_factory=dict_row
-        )
+# Сколько /ready ждёт ответа БД
+READY_DB_TIMEOUT = float(os.getenv("READY_DB_TIMEOUT", "2"))
 
 
 @app.get("/")
@@ -56,6 +110,13 @@ def ping():
     return {"message": "pong"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Метрики в формате Prometheus"""
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
 @app.get("/env")
 def check_env():
     """Проверка переменных окружения"""
@@ -71,50 +132,54 @@ def check_env():
 
 
 @app.get("/db-info")
-def db_info():
-    """Информация о подключенной базе данных"""
+async def db_info():
+    """Информация о подключенной базе данных (с реплики, если она используется)"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Информация о подключении
-                cur.execute("SELECT current_database() as db_name, current_user as db_user;")
-                info = cur.fetchone()
-
-                # Список таблиц
-                cur.execute("""
-                            SELECT table_name
-                            FROM information_schema.tables
-                            WHERE table_schema = 'public'
-                            ORDER BY table_name;
-                            """)
-                tables = [row["table_name"] for row in cur.fetchall()]
-
-                # Проверяем таблицу dishes
-                has_dishes = "dishes" in tables
-                dishes_count = 0
-                dishes_columns = []
-
-                if has_dishes:
-                    cur.execute("SELECT COUNT(*) as cnt FROM dishes;")
-                    dishes_count = cur.fetchone()["cnt"]
-
-                    # Получаем информацию о колонках
-                    cur.execute("""
+        async with get_read_connection() as conn:
+            info_cur, tables_cur, columns_cur, count_cur = (conn.cursor() for _ in range(4))
+            dishes_count = 0
+            # Запросы независимы - отправляем их одним пакетом (pipeline mode): один round trip вместо четырёх
+            try:
+                async with timed_pipeline(conn):
+                    # Информация о подключении
+                    await info_cur.execute("SELECT current_database() as db_name, current_user as db_user;")
+
+                    # Список таблиц
+                    await tables_cur.execute("""
+                                SELECT table_name
+                                FROM information_schema.tables
+                                WHERE table_schema = 'public'
+                                ORDER BY table_name;
+                                """)
+
+                    # Информация о колонках dishes
+                    await columns_cur.execute("""
                                 SELECT column_name, data_type
                                 FROM information_schema.columns
                                 WHERE table_name = 'dishes'
                                 ORDER BY ordinal_position;
                                 """)
-                    dishes_columns = cur.fetchall()
 
-                return {
-                    "connection": info,
-                    "tables": tables,
-                    "total_tables": len(tables),
-                    "has_dishes_table": has_dishes,
-                    "dishes_count": dishes_count,
-                    "dishes_columns": dishes_columns
-                }
+                    # Последним: если таблицы dishes нет, упадёт только он
+                    await count_cur.execute("SELECT COUNT(*) as cnt FROM dishes;")
+            except psycopg.errors.UndefinedTable:
+                await conn.rollback()
+            else:
+                dishes_count = (await count_cur.fetchone())["cnt"]
+
+            info = await info_cur.fetchone()
+            tables = [row["table_name"] for row in await tables_cur.fetchall()]
+            dishes_columns = await columns_cur.fetchall()
+            has_dishes = "dishes" in tables
+
+            return {
+                "connection": info,
+                "tables": tables,
+                "total_tables": len(tables),
+                "has_dishes_table": has_dishes,
+                "dishes_count": dishes_count,
+                "dishes_columns": dishes_columns
+            }
     except Exception as e:
         return {"error": str(e)}
 
@@ -141,107 +206,35 @@ def test_connection():
 
 
 @app.post("/setup-dishes")
-def setup_dishes():
-    """Создать таблицу dishes с нужными колонками"""
+async def setup_dishes():
+    """Применить миграции схемы (обычно они уже применены при старте)"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Проверяем, есть ли уже таблица
-                cur.execute("""
-                            SELECT EXISTS (SELECT
-                                           FROM information_schema.tables
-                                           WHERE table_schema = 'public'
-                                             AND table_name = 'dishes');
-                            """)
-                exists = cur.fetchone()["exists"]
-
-                if not exists:
-                    # Создаём таблицу с ВСЕМИ нужными колонками
-                    cur.execute("""
-                                CREATE TABLE dishes
-                                (
-                                    id            SERIAL PRIMARY KEY,
-                                    name          VARCHAR(255)   NOT NULL,
-                                    description   TEXT,
-                                    price         DECIMAL(10, 2) NOT NULL,
-                                    category      VARCHAR(100),
-                                    delivery_time INTEGER,
-                                    rating        DECIMAL(3, 1),
-                                    image_url     VARCHAR(500),
-                                    created_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                                );
-                                """)
-                    conn.commit()
-                    return {
-                        "status": "created",
-                        "message": "Table 'dishes' created with all columns",
-                        "columns": ["id", "name", "description", "price", "category", "delivery_time", "rating",
-                                    "image_url", "created_at"]
-                    }
-                else:
-                    # Таблица уже есть, добавляем недостающие колонки
-                    added_columns = []
-
-                    # Проверяем и добавляем delivery_time
-                    cur.execute("""
-                                SELECT column_name
-                                FROM information_schema.columns
-                                WHERE table_name = 'dishes'
-                                  AND column_name = 'delivery_time'
-                                """)
-                    if not cur.fetchone():
-                        cur.execute("ALTER TABLE dishes ADD COLUMN delivery_time INTEGER;")
-                        added_columns.append("delivery_time")
-
-                    # Проверяем и добавляем rating
-                    cur.execute("""
-                                SELECT column_name
-                                FROM information_schema.columns
-                                WHERE table_name = 'dishes'
-                                  AND column_name = 'rating'
-                                """)
-                    if not cur.fetchone():
-                        cur.execute("ALTER TABLE dishes ADD COLUMN rating DECIMAL(3,1);")
-                        added_columns.append("rating")
-
-                    conn.commit()
-
-                    if added_columns:
-                        return {
-                            "status": "updated",
-                            "message": f"Added missing columns: {', '.join(added_columns)}",
-                            "added_columns": added_columns
-                        }
-                    else:
-                        return {
-                            "status": "already_complete",
-                            "message": "Table 'dishes' already has all required columns"
-                        }
+        applied = await run_migrations()
+        if applied:
+            catalog_cache.clear()
+            return {
+                "status": "updated",
+                "message": f"Applied migrations: {', '.join(applied)}",
+                "applied_migrations": applied
+            }
+        else:
+            return {
+                "status": "already_complete",
+                "message": "Schema is up to date"
+            }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/add-sample-dishes")
-def add_sample_dishes():
+async def add_sample_dishes():
     """Добавить 10 примеров блюд"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Сначала убедимся, что таблица и колонки есть
-                cur.execute("""
-                            SELECT column_name
-                            FROM information_schema.columns
-                            WHERE table_name = 'dishes'
-                            """)
-                columns = [row["column_name"] for row in cur.fetchall()]
-
-                if not columns:
-                    raise HTTPException(status_code=400,
-                                        detail="Table 'dishes' does not exist. Call /setup-dishes first.")
-
+        async with get_async_connection() as conn:
+            async with conn.cursor() as cur:
                 # Очищаем старые данные (опционально)
-                cur.execute("TRUNCATE dishes RESTART IDENTITY;")
+                await cur.execute("TRUNCATE dishes RESTART IDENTITY;")
 
                 # Добавляем 10 популярных блюд
                 dishes = [
@@ -257,18 +250,14 @@ def add_sample_dishes():
                     ("Spaghetti Carbonara", "Pasta with bacon and eggs", 12.99, "Italian", 22, 4.7)
                 ]
 
-                for dish in dishes:
-                    name, description, price, category, delivery_time, rating = dish
-                    cur.execute("""
-                                INSERT INTO dishes (name, description, price, category, delivery_time, rating)
-                                VALUES (%s, %s, %s, %s, %s, %s)
-                                """, (name, description, price, category, delivery_time, rating))
+                await copy_dishes(cur, dishes, SEED_COLUMNS)
 
-                conn.commit()
-
-                # Проверяем результат
-                cur.execute("SELECT COUNT(*) as count FROM dishes;")
-                count = cur.fetchone()["count"]
+                # Проверка результата и COMMIT - одним пакетом (NOTIFY шлёт триггер catalog_version)
+                async with timed_pipeline(conn):
+                    await cur.execute("SELECT COUNT(*) as count FROM dishes;")
+                    await conn.commit()
+                catalog_cache.clear()
+                count = (await cur.fetchone())["count"]
 
                 return {
                     "success": True,
@@ -281,13 +270,13 @@ def add_sample_dishes():
 
 
 @app.post("/add-100-dishes")
-def add_100_dishes():
+async def add_100_dishes():
     """Добавить 100 разнообразных блюд"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
+        async with get_async_connection() as conn:
+            async with conn.cursor() as cur:
                 # Очищаем старые данные
-                cur.execute("TRUNCATE dishes RESTART IDENTITY;")
+                await cur.execute("TRUNCATE dishes RESTART IDENTITY;")
 
                 # 100 блюд: (name, description, price, category, delivery_time, rating)
                 dishes_100 = [
@@ -406,33 +395,27 @@ def add_100_dishes():
                     ("Salsa & Chips", "Chips with salsa", 4.49, "Mexican", 10, 4.4),
                 ]
 
-                # Добавляем все 100 блюд
-                for dish in dishes_100:
-                    name, description, price, category, delivery_time, rating = dish
-                    cur.execute("""
-                                INSERT INTO dishes (name, description, price, category, delivery_time, rating)
-                                VALUES (%s, %s, %s, %s, %s, %s)
-                                """, (name, description, price, category, delivery_time, rating))
-
-                conn.commit()
+                # Добавляем все 100 блюд одним COPY
+                await copy_dishes(cur, dishes_100, SEED_COLUMNS)
 
-                # Проверяем результат
-                cur.execute("SELECT COUNT(*) as count FROM dishes;")
-                count = cur.fetchone()["count"]
+                # Проверка результата по сводке категорий (её обновляют триггеры) и COMMIT -
+                # одним пакетом (NOTIFY шлёт триггер catalog_version)
+                async with timed_pipeline(conn):
+                    await cur.execute("""
+                                SELECT category, dish_count
+                                FROM category_stats
+                                ORDER BY dish_count DESC, category
+                                """)
+                    await conn.commit()
+                catalog_cache.clear()
+                categories = {row["category"]: row["dish_count"] for row in await cur.fetchall()}
+                count = sum(categories.values())
 
                 return {
                     "success": True,
                     "message": f"Added {count} dishes to database",
                     "dishes_count": count,
-                    "categories": {
-                        "Healthy": 20,
-                        "Fast Food": 20,
-                        "Pizza": 15,
-                        "Asian": 15,
-                        "Italian": 10,
-                        "Dessert": 10,
-                        "Mexican": 10
-                    }
+                    "categories": categories
                 }
 
     except Exception as e:
@@ -440,93 +423,431 @@ def add_100_dishes():
 
 
 @app.get("/dishes")
-def get_dishes():
-    """Получить все блюда. Если таблица пустая - создаём автоматически."""
+async def get_dishes(
+        request: Request,
+        limit: int = Query(50, ge=1, le=500),
+        after: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        max_delivery_time: Optional[int] = None,
+        min_rating: Optional[Decimal] = None,
+        sort: str = Query("id", pattern="^(id|rating|price|delivery_time)$"),
+        order: str = Query("asc", pattern="^(asc|desc)$"),
+        compact: bool = False,
+        fields: Optional[str] = None,
+):
+    """Получить блюда постранично (keyset-пагинация по курсору after).
+    Если таблица пустая - заполняем её автоматически.
+
+    compact=true - блюда массивами значений в порядке "columns" (без dict на строку).
+    fields=name,price,rating (или fields=list) - только эти колонки (плюс id и колонка сортировки).
+    """
+    cursor = None
+    if after:
+        try:
+            cursor = decode_cursor(after, sort, order)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Проверяем, есть ли таблица и данные
-                cur.execute("""
-                            SELECT EXISTS (SELECT
-                                           FROM information_schema.tables
-                                           WHERE table_schema = 'public'
-                                             AND table_name = 'dishes');
-                            """)
-                table_exists = cur.fetchone()["exists"]
-
-                if not table_exists:
-                    # Таблицы нет - создаём её
-                    cur.execute("""
-                                CREATE TABLE dishes
-                                (
-                                    id            SERIAL PRIMARY KEY,
-                                    name          VARCHAR(255)   NOT NULL,
-                                    description   TEXT,
-                                    price         DECIMAL(10, 2) NOT NULL,
-                                    category      VARCHAR(100),
-                                    delivery_time INTEGER,
-                                    rating        DECIMAL(3, 1),
-                                    image_url     VARCHAR(500),
-                                    created_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                                );
-                                """)
+        columns = parse_fields(fields, sort)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = {
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "max_delivery_time": max_delivery_time,
+        "min_rating": min_rating,
+    }
 
-                # Проверяем, есть ли данные
-                cur.execute("SELECT COUNT(*) as cnt FROM dishes;")
-                count = cur.fetchone()["cnt"]
-
-                if count == 0:
-                    # Данных нет - добавляем 20 популярных блюд автоматически
-                    dishes_data = [
-                        ("Chicken Hell", "Grilled chicken with vegetables", 12.99, "Healthy", 24, 4.8),
-                        ("Salmon Heaven", "Baked salmon with quinoa", 15.99, "Healthy", 28, 4.7),
-                        ("Avocado Toast", "Whole grain toast with avocado", 8.99, "Healthy", 15, 4.5),
-                        ("Cheese Burger", "Classic cheeseburger with fries", 8.99, "Fast Food", 18, 4.6),
-                        ("Margarita Pizza", "Classic tomato and cheese", 11.99, "Pizza", 25, 4.7),
-                        ("Chicken Teriyaki", "Teriyaki chicken with rice", 11.99, "Asian", 22, 4.7),
-                        ("Chocolate Cake", "Rich chocolate cake", 6.99, "Dessert", 15, 4.8),
-                        ("Burrito", "Chicken burrito", 10.99, "Mexican", 22, 4.7),
-                        ("Pancakes", "3 pancakes with syrup", 7.99, "Breakfast", 15, 4.7),
-                        ("Spaghetti Carbonara", "Pasta with bacon and eggs", 12.99, "Italian", 22, 4.7),
-                        ("Greek Salad", "Fresh Greek salad with feta", 9.99, "Healthy", 18, 4.4),
-                        ("French Fries", "Golden crispy fries", 3.99, "Fast Food", 12, 4.5),
-                        ("Sushi Roll", "California roll (8 pcs)", 9.99, "Asian", 20, 4.6),
-                        ("Lasagna", "Meat lasagna", 13.99, "Italian", 30, 4.8),
-                        ("Ice Cream", "3 scoops of ice cream", 5.99, "Dessert", 12, 4.5),
-                        ("Tacos", "3 beef tacos", 9.99, "Mexican", 20, 4.6),
-                        ("Ramen", "Japanese ramen soup", 10.99, "Asian", 24, 4.7),
-                        ("BBQ Bacon Burger", "Burger with bacon and BBQ", 10.99, "Fast Food", 22, 4.8),
-                        ("Tiramisu", "Coffee dessert", 6.99, "Italian", 18, 4.8),
-                        ("Spring Rolls", "Vegetable spring rolls (4 pcs)", 6.99, "Asian", 18, 4.5),
-                    ]
-
-                    for dish in dishes_data:
-                        name, description, price, category, delivery_time, rating = dish
-                        cur.execute("""
-                                    INSERT INTO dishes (name, description, price, category, delivery_time, rating)
-                                    VALUES (%s, %s, %s, %s, %s, %s)
-                                    """, (name, description, price, category, delivery_time, rating))
-
-                    conn.commit()
-                    print(f"✅ Automatically created table and added {len(dishes_data)} dishes")
-
-                # Теперь получаем все блюда
-                cur.execute("SELECT * FROM dishes ORDER BY id;")
-                dishes = cur.fetchall()
+    async def fetch_page(cur):
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        nulls = cursor is not None and cursor["value"] is None
+        query, params = build_dishes_query(filters, sort, order, cursor, nulls, limit + 1,
+                                           numeric_as_float=True, columns=columns)
+
+        if sort == "id" or nulls:
+            await cur.execute(query, params, prepare=True)
+            return await cur.fetchall()
+
+        # Блюда без значения колонки сортировки идут в конце выдачи. Их запрос
+        # отправляем сразу, в том же пакете (pipeline mode): лишние строки
+        # дешевле второго round trip до БД
+        nulls_query, nulls_params = build_dishes_query(filters, sort, order, None, True, limit + 1,
+                                                       numeric_as_float=True, columns=columns)
+        async with cur.connection.cursor(row_factory=cur.row_factory) as nulls_cur:
+            async with timed_pipeline(cur.connection):
+                await cur.execute(query, params, prepare=True)
+                await nulls_cur.execute(nulls_query, nulls_params, prepare=True)
+            return merge_null_phase(await cur.fetchall(), await nulls_cur.fetchall(), limit)
+
+    async def load():
+        # Схему создают миграции при старте - сразу идём за данными
+        row_factory = tuple_row if compact else dict_row
+        async with get_read_connection() as conn:
+            async with conn.cursor(row_factory=row_factory) as cur:
+                dishes = await fetch_page(cur)
+        auto_created = False
+
+        if not dishes and cursor is None and all(v is None for v in filters.values()):
+            # Данных нет - добавляем 20 популярных блюд автоматически
+            dishes_data = [
+                ("Chicken Hell", "Grilled chicken with vegetables", 12.99, "Healthy", 24, 4.8),
+                ("Salmon Heaven", "Baked salmon with quinoa", 15.99, "Healthy", 28, 4.7),
+                ("Avocado Toast", "Whole grain toast with avocado", 8.99, "Healthy", 15, 4.5),
+                ("Cheese Burger", "Classic cheeseburger with fries", 8.99, "Fast Food", 18, 4.6),
+                ("Margarita Pizza", "Classic tomato and cheese", 11.99, "Pizza", 25, 4.7),
+                ("Chicken Teriyaki", "Teriyaki chicken with rice", 11.99, "Asian", 22, 4.7),
+                ("Chocolate Cake", "Rich chocolate cake", 6.99, "Dessert", 15, 4.8),
+                ("Burrito", "Chicken burrito", 10.99, "Mexican", 22, 4.7),
+                ("Pancakes", "3 pancakes with syrup", 7.99, "Breakfast", 15, 4.7),
+                ("Spaghetti Carbonara", "Pasta with bacon and eggs", 12.99, "Italian", 22, 4.7),
+                ("Greek Salad", "Fresh Greek salad with feta", 9.99, "Healthy", 18, 4.4),
+                ("French Fries", "Golden crispy fries", 3.99, "Fast Food", 12, 4.5),
+                ("Sushi Roll", "California roll (8 pcs)", 9.99, "Asian", 20, 4.6),
+                ("Lasagna", "Meat lasagna", 13.99, "Italian", 30, 4.8),
+                ("Ice Cream", "3 scoops of ice cream", 5.99, "Dessert", 12, 4.5),
+                ("Tacos", "3 beef tacos", 9.99, "Mexican", 20, 4.6),
+                ("Ramen", "Japanese ramen soup", 10.99, "Asian", 24, 4.7),
+                ("BBQ Bacon Burger", "Burger with bacon and BBQ", 10.99, "Fast Food", 22, 4.8),
+                ("Tiramisu", "Coffee dessert", 6.99, "Italian", 18, 4.8),
+                ("Spring Rolls", "Vegetable spring rolls (4 pcs)", 6.99, "Asian", 18, 4.5),
+            ]
+
+            # Пишем на primary и там же перечитываем: реплика могла ещё не получить новые строки
+            async with get_async_connection() as conn:
+                async with conn.cursor(row_factory=row_factory) as cur:
+                    # Пустую таблицу могут одновременно увидеть несколько воркеров (прогрев):
+                    # добавляет блюда только первый, остальные после блокировки видят его строки
+                    await conn.execute("SELECT pg_advisory_xact_lock(%s);", (SEED_LOCK_ID,))
+                    seeded = await conn.execute("SELECT EXISTS (SELECT 1 FROM dishes) AS seeded;")
+                    if not (await seeded.fetchone())["seeded"]:
+                        await copy_dishes(cur, dishes_data, SEED_COLUMNS)
+                        await conn.commit()
+                        catalog_cache.clear()
+                        print(f"✅ Automatically added {len(dishes_data)} dishes")
+                        auto_created = True
+                    else:
+                        await conn.commit()
 
-                return {
+                    dishes = await fetch_page(cur)
+
+        dishes, next_cursor = paginate(dishes, limit, sort, order, columns if compact else None)
+
+        result = {
+            "success": True,
+            "count": len(dishes),
+            "dishes": dishes,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            "auto_created": auto_created  # Показывает, были ли данные созданы автоматически
+        }
+        if compact:
+            result["columns"] = columns
+
+        # В кэш кладём уже готовое тело ответа - повторная сериализация
+        # и сжатие не нужны
+        return CachedBody(dumps(result))
+
+    # Ключ кэша - нормализованные параметры запроса
+    key = ("dishes", limit, after, sort, order, compact, columns, tuple(sorted(filters.items())))
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    try:
+        # Версию читаем до данных: ответ может оказаться новее ETag, но не старее
+        version = await get_catalog_version()
+        if version is not None and is_not_modified(request, version, encoding):
+            return not_modified_response(request, version, encoding, catalog_cache.get_stale(key))
+
+        cached = await catalog_cache.get_or_load(key, load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return cached_json_response(cached, encoding, version)
+
+
+@app.get("/categories")
+async def get_categories(request: Request):
+    """Статистика по категориям из сводной таблицы category_stats"""
+    async def load():
+        async with get_read_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(CATEGORY_STATS_QUERY, prepare=True)
+                categories = await cur.fetchall()
+                return CachedBody(dumps({
                     "success": True,
+                    "count": len(categories),
+                    "categories": categories
+                }))
+
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    try:
+        version = await get_catalog_version()
+        if version is not None and is_not_modified(request, version, encoding):
+            return not_modified_response(request, version, encoding, catalog_cache.get_stale(("categories",)))
+
+        cached = await catalog_cache.get_or_load(("categories",), load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return cached_json_response(cached, encoding, version)
+
+
+async def get_dishes_by_ids(ids):
+    """Блюда по id в порядке запроса: из кэша по id, промахи - одним запросом к БД"""
+    try:
+        ids = parse_ids(ids)
+    except InvalidIds as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def load(missing):
+        query, params = build_batch_query(missing)
+        async with get_read_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params, prepare=True)
+                return {dish["id"]: dish for dish in await cur.fetchall()}
+
+    try:
+        found = await dish_cache.get_many_or_load(ids, load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "count": len(found),
+        "dishes": [found[dish_id] for dish_id in ids if dish_id in found],
+        "missing": [dish_id for dish_id in ids if dish_id not in found]
+    }
+
+
+@app.get("/dishes/batch")
+async def get_dishes_batch(ids: str = Query(..., description="id через запятую: 1,2,3")):
+    """Несколько блюд по id (корзина, история заказов) одним запросом"""
+    return await get_dishes_by_ids(ids)
+
+
+@app.post("/dishes/batch")
+async def post_dishes_batch(ids: list[int] = Body(..., embed=True)):
+    """То же, что GET /dishes/batch, для длинных списков: {"ids": [1, 2, 3]}"""
+    return await get_dishes_by_ids(ids)
+
+
+@app.get("/dishes/changes")
+async def get_dish_changes(
+        since: Optional[str] = None,
+        limit: int = Query(500, ge=1, le=5000),
+        fields: Optional[str] = None,
+):
+    """Изменения каталога после курсора since (delta-sync).
+
+    Без since - весь каталог с начала. Клиент удаляет у себя блюда из "deleted",
+    затем обновляет/добавляет "dishes", сохраняет next_cursor и повторяет запрос,
+    пока has_more. Объём синхронизации зависит от числа изменений, а не от размера каталога.
+    """
+    position = (0, 0)
+    if since:
+        try:
+            position = decode_changes_cursor(since)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        columns = parse_fields(fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    (upserts_query, upserts_params), (deletes_query, deletes_params) = build_changes_queries(
+        *position, limit + 1, columns
+    )
+    try:
+        async with get_read_connection() as conn:
+            async with conn.cursor() as bound_cur, conn.cursor() as upserts_cur, conn.cursor() as deletes_cur:
+                # Граница выборки и обе таблицы - одним пакетом
+                async with timed_pipeline(conn):
+                    await bound_cur.execute(CHANGES_BOUND_QUERY)
+                    await upserts_cur.execute(upserts_query, upserts_params, prepare=True)
+                    await deletes_cur.execute(deletes_query, deletes_params, prepare=True)
+                upper = int((await bound_cur.fetchone())["xmin"])
+                upserts = await upserts_cur.fetchall()
+                deletes = await deletes_cur.fetchall()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Только транзакции, завершённые до границы: более поздние придут в следующий раз,
+    # поэтому медленная транзакция с меньшим xid не окажется позади курсора
+    changes = sorted(
+        [(int(row.pop("change_position")), row["id"], row) for row in upserts]
+        + [(int(row["change_position"]), row["id"], None) for row in deletes],
+        key=lambda change: change[:2],
+    )
+    changes = [change for change in changes if change[0] < upper]
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if has_more:
+        next_position = changes[-1][:2]
+    else:
+        next_position = max(position, (upper, 0))
+
+    return {
+        "success": True,
+        "count": len(changes),
+        "dishes": [row for _, _, row in changes if row is not None],
+        "deleted": [dish_id for _, dish_id, row in changes if row is None],
+        "next_cursor": encode_changes_cursor(*next_position),
+        "has_more": has_more
+    }
+
+
+@app.get("/dishes/search")
+async def search_dishes(
+        request: Request,
+        q: str = Query(..., min_length=1, max_length=200),
+        category: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+):
+    """Поиск блюд по названию и описанию (с учётом опечаток и по префиксу)"""
+    text = " ".join(q.split())
+    query, params = build_search_query(text, category, limit)
+
+    async def load():
+        async with get_read_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params, prepare=True)
+                dishes = await cur.fetchall()
+                return CachedBody(dumps({
+                    "success": True,
+                    "query": text,
                     "count": len(dishes),
-                    "dishes": dishes,
-                    "auto_created": count == 0  # Показывает, были ли данные созданы автоматически
-                }
+                    "dishes": dishes
+                }))
+
+    try:
+        cached = await catalog_cache.get_or_load(("search", text.lower(), category, limit), load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return cached_json_response(cached, choose_encoding(request.headers.get("accept-encoding", "")))
+
+
+@app.get("/dishes/stream")
+async def stream_dishes(
+        request: Request,
+        category: Optional[str] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        max_delivery_time: Optional[int] = None,
+        min_rating: Optional[Decimal] = None,
+        batch_size: int = Query(1000, ge=1, le=10000),
+        fields: Optional[str] = None,
+):
+    """Выгрузить весь каталог в NDJSON.
+
+    Строки читаются серверным (именованным) курсором пачками по batch_size
+    и сразу отправляются клиенту, поэтому память не зависит от размера таблицы.
+    fields= - как в /dishes.
+    """
+    try:
+        columns = parse_fields(fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = {
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "max_delivery_time": max_delivery_time,
+        "min_rating": min_rating,
+    }
+    query, params = build_dishes_query(filters, limit=None, numeric_as_float=True, columns=columns)
+
+    try:
+        version = await get_catalog_version()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {}
+    if version is not None:
+        headers = catalog_headers(version)
+        if is_not_modified(request, version):
+            return Response(status_code=304, headers=headers)
+
+    async def generate():
+        async with get_read_connection() as conn:
+            # Серверный курсор живёт внутри транзакции соединения из пула
+            async with conn.cursor(name="dishes_export") as cur:
+                await cur.execute(query, params)
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield to_ndjson(rows)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
+
+@app.post("/dishes/import")
+async def import_dishes_endpoint(
+        request: Request,
+        format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+        batch_size: int = Query(5000, ge=1, le=100000),
+):
+    """Массовая загрузка блюд из CSV (с заголовком) или NDJSON через COPY.
+
+    Тело читается потоком: следующий кусок берётся только после записи
+    предыдущей пачки в БД. Каждая пачка - отдельная транзакция.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        if "csv" in content_type:
+            format = "csv"
+        elif "ndjson" in content_type or "jsonl" in content_type:
+            format = "ndjson"
+        else:
+            raise HTTPException(status_code=415,
+                                detail="Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson")
+
+    lines = iter_lines(request.stream())
+    records = iter_csv_records(lines) if format == "csv" else iter_ndjson_records(lines)
+
+    try:
+        async with get_async_connection() as conn:
+            report = await import_dishes(conn, records, batch_size)
+        catalog_cache.clear()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {
+        "success": not report["failed_batches"] and not report["error_count"] and not report["aborted"],
+        **report
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """Готовность принимать трафик (readiness): воркер прогрет и БД отвечает.
+
+    В отличие от /health (liveness - процесс жив), вернёт 503 до конца прогрева,
+    при остановке воркера и если БД недоступна.
+    """
+    if not getattr(app.state, "ready", False):
+        return FastJSONResponse({"status": "starting"}, status_code=503)
+    try:
+        async def check():
+            async with get_async_connection() as conn:
+                await conn.execute("SELECT 1;")
+
+        await asyncio.wait_for(check(), READY_DB_TIMEOUT)
+    except Exception as e:
+        return FastJSONResponse({"status": "unavailable", "error": str(e)}, status_code=503)
+    return {"status": "ready"}
+
 
 @app.get("/health")
 def health():
-    """Проверка здоровья API"""
+    """Проверка здоровья API (liveness: процесс жив, БД не проверяется)"""
     return {
         "status": "healthy",
         "service": "Eatly Backend API",
@@ -534,11 +855,19 @@ def health():
             "root": "/",
             "ping": "/ping",
             "env": "/env",
+            "metrics": "/metrics",
+            "ready": "/ready",
             "db_info": "/db-info",
             "test": "/test-connection",
             "setup_dishes": "POST /setup-dishes",
             "add_sample_dishes": "POST /add-sample-dishes",
             "add_100_dishes": "POST /add-100-dishes",
-            "get_dishes": "/dishes"
+            "get_dishes": "/dishes",
+            "categories": "/categories",
+            "batch_dishes": "/dishes/batch?ids=1,2,3",
+            "dish_changes": "/dishes/changes?since=...",
+            "search_dishes": "/dishes/search?q=...",
+            "stream_dishes": "/dishes/stream",
+            "import_dishes": "POST /dishes/import"
         }
     }
\ No newline at end of file
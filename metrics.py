@@ -0,0 +1,289 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import psycopg
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY
+from prometheus_client import generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from psycopg import sql
+from starlette.routing import Match
+
+from tracing import explain_query, explain_query_async, log_slow_query, trace_query
+
+
+# Маршрут текущего запроса - чтобы метрики БД можно было разложить по эндпоинтам
+current_route = ContextVar("current_route", default="<background>")
+# Запросы, поставленные в очередь внутри timed_pipeline: учитываются после синхронизации
+pipeline_statements = ContextVar("pipeline_statements", default=None)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+)
+REQUESTS_TOTAL = Counter(
+    "http_requests_total", "HTTP requests by status code", ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being processed", ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "DB statement execution time", ["route", "operation"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+DB_ROWS = Counter(
+    "db_rows_total", "Rows returned or affected by DB statements", ["route", "operation"],
+)
+DB_CONNECTION_ACQUIRE = Histogram(
+    "db_connection_acquire_seconds", "Time to get a connection from the pool", ["pool"],
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30),
+)
+DB_CONNECTION_CREATE = Histogram(
+    "db_connection_create_seconds", "Time to open a new DB connection (TCP + TLS + auth)", ["pool"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds", "Replication lag of the read replica at the last check",
+    multiprocess_mode="max",
+)
+DB_REPLICA_IN_USE = Gauge(
+    "db_replica_in_use", "1 if reads are routed to the replica, 0 if to the primary",
+    multiprocess_mode="min",
+)
+
+ADMISSION_QUEUE = Gauge(
+    "admission_queue_length", "Requests waiting for an admission slot",
+    multiprocess_mode="livesum",
+)
+LOAD_SHED = Counter(
+    "http_requests_shed_total", "Requests that did not get an admission slot", ["reason", "outcome"],
+)
+
+OPERATIONS = {
+    "select", "insert", "update", "delete", "copy", "with", "truncate", "create", "alter", "drop",
+    "notify", "listen", "explain",
+}
+
+
+def _operation(query):
+    """Тип запроса по первому слову (ограниченный набор значений для метки)"""
+    while isinstance(query, sql.Composed):
+        query = next(iter(query), "")
+    if isinstance(query, sql.SQL):
+        query = query._obj
+    if isinstance(query, bytes):
+        query = query[:32].decode(errors="ignore")
+    words = query.split(None, 1) if isinstance(query, str) else None
+    if not words:
+        return "other"
+    operation = words[0].lower()
+    return operation if operation in OPERATIONS else "other"
+
+
+def _observe_query(cursor, query, elapsed, batch=None):
+    """Метрики, трасса запроса и слоу-лог. True - нужно снять EXPLAIN (см. tracing.trace_query)."""
+    route = current_route.get()
+    operation = _operation(query)
+    rowcount = cursor.rowcount
+    DB_QUERY_LATENCY.labels(route, operation).observe(elapsed)
+    if rowcount and rowcount > 0:
+        DB_ROWS.labels(route, operation).inc(rowcount)
+    return trace_query(cursor, query, operation, elapsed, rowcount, batch)
+
+
+@asynccontextmanager
+async def timed_pipeline(conn):
+    """conn.pipeline() с учётом запросов в метриках и трассе.
+
+    В pipeline mode execute() только ставит запрос в очередь и возвращается до
+    ответа сервера. Поэтому каждому запросу пакета засчитывается время всего
+    пакета (до синхронизации при выходе), а число строк берётся уже из результата.
+    EXPLAIN для медленных запросов пакета не снимается.
+    """
+    statements = []
+    token = pipeline_statements.set(statements)
+    started = time.perf_counter()
+    try:
+        async with conn.pipeline() as pipeline:
+            yield pipeline
+    finally:
+        elapsed = time.perf_counter() - started
+        pipeline_statements.reset(token)
+        for cursor, query in statements:
+            if _observe_query(cursor, query, elapsed, batch=len(statements)):
+                log_slow_query(cursor, query, elapsed, cursor.rowcount)
+
+
+class TimedCursor(psycopg.Cursor):
+    """Курсор, который пишет время выполнения и число строк в метрики"""
+
+    def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            explain = _observe_query(self, query, elapsed)
+        if explain:
+            log_slow_query(self, query, elapsed, self.rowcount, explain_query(self, query, params))
+        return self
+
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    """Асинхронный вариант TimedCursor"""
+
+    async def execute(self, query, params=None, **kwargs):
+        statements = pipeline_statements.get()
+        if statements is not None and self.connection._pipeline is not None:
+            # Запрос только поставлен в очередь - учтём его при выходе из timed_pipeline
+            await super().execute(query, params, **kwargs)
+            statements.append((self, query))
+            return self
+
+        started = time.perf_counter()
+        try:
+            await super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            explain = _observe_query(self, query, elapsed)
+        if explain:
+            plan = await explain_query_async(self, query, params)
+            log_slow_query(self, query, elapsed, self.rowcount, plan)
+        return self
+
+
+class TimedConnection(psycopg.Connection):
+    """Соединение, которое замеряет время подключения к БД"""
+
+    @classmethod
+    def connect(cls, *args, **kwargs):
+        started = time.perf_counter()
+        conn = super().connect(*args, **kwargs)
+        DB_CONNECTION_CREATE.labels("sync").observe(time.perf_counter() - started)
+        return conn
+
+
+class TimedAsyncConnection(psycopg.AsyncConnection):
+    """Асинхронный вариант TimedConnection"""
+
+    @classmethod
+    async def connect(cls, *args, **kwargs):
+        started = time.perf_counter()
+        conn = await super().connect(*args, **kwargs)
+        DB_CONNECTION_CREATE.labels("async").observe(time.perf_counter() - started)
+        return conn
+
+
+POOL_STATS = {
+    "pool_size": ("db_pool_size", "Connections in the pool"),
+    "pool_available": ("db_pool_available", "Idle connections"),
+    "requests_waiting": ("db_pool_requests_waiting", "Clients waiting"),
+}
+# Как часто воркер пишет статистику пулов в PROMETHEUS_MULTIPROC_DIR, секунд
+POOL_STATS_INTERVAL = float(os.getenv("POOL_STATS_INTERVAL", "5"))
+
+
+def multiprocess_enabled():
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+class PoolStatsCollector:
+    """Размер пулов и очередь ожидающих соединение (psycopg_pool get_stats)"""
+
+    def __init__(self, get_pools):
+        self.get_pools = get_pools
+
+    def collect(self):
+        stats = {
+            key: GaugeMetricFamily(name, documentation, labels=["pool"])
+            for key, (name, documentation) in POOL_STATS.items()
+        }
+        for name, pool in self.get_pools().items():
+            pool_stats = pool.get_stats()
+            for key, family in stats.items():
+                family.add_metric([name], pool_stats.get(key, 0))
+        return list(stats.values())
+
+
+# Та же статистика в многопроцессном режиме: у каждого воркера свои пулы (метка pid).
+# Не в глобальном REGISTRY - там эти имена уже занимает PoolStatsCollector.
+_POOL_GAUGES = {
+    key: Gauge(name, documentation, ["pool"], registry=None, multiprocess_mode="liveall")
+    for key, (name, documentation) in POOL_STATS.items()
+}
+
+
+async def export_pool_stats(get_pools):
+    """Фоновая задача воркера при PROMETHEUS_MULTIPROC_DIR: статистика пулов в общий каталог метрик"""
+    try:
+        while True:
+            for name, pool in get_pools().items():
+                pool_stats = pool.get_stats()
+                for key, gauge in _POOL_GAUGES.items():
+                    gauge.labels(name).set(pool_stats.get(key, 0))
+            await asyncio.sleep(POOL_STATS_INTERVAL)
+    finally:
+        # Воркер останавливается - его live-гауги больше не показываем
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics():
+    """Тело и Content-Type для /metrics.
+
+    С несколькими воркерами uvicorn задайте PROMETHEUS_MULTIPROC_DIR - тогда
+    метрики собираются со всех процессов, статистика пулов - с меткой pid
+    (её пишет export_pool_stats раз в POOL_STATS_INTERVAL секунд).
+    """
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def _route_template(scope):
+    """Шаблон пути (/dishes/{id}), а не сам URL - иначе метки не ограничены"""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Задержка, статусы и число одновременных запросов по маршрутам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = _route_template(scope)
+        token = current_route.set(route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            REQUESTS_TOTAL.labels(method, route, str(status)).inc()
+            in_progress.dec()
+            current_route.reset(token)
@@ -0,0 +1,424 @@
+import os
+
+import psycopg
+
+from db import get_conninfo
+
+
+# Ключ advisory lock: миграции выполняет только один воркер, остальные ждут
+MIGRATIONS_LOCK_ID = 72431001
+
+DISHES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS dishes
+    (
+        id            SERIAL PRIMARY KEY,
+        name          VARCHAR(255)   NOT NULL,
+        description   TEXT,
+        price         DECIMAL(10, 2) NOT NULL,
+        category      VARCHAR(100),
+        delivery_time INTEGER,
+        rating        DECIMAL(3, 1),
+        image_url     VARCHAR(500),
+        created_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+]
+
+# Для баз, где dishes создавалась старой версией без этих колонок
+DISHES_COLUMNS_DDL = [
+    "ALTER TABLE dishes ADD COLUMN IF NOT EXISTS delivery_time INTEGER;",
+    "ALTER TABLE dishes ADD COLUMN IF NOT EXISTS rating DECIMAL(3, 1);",
+]
+
+# Индексы под фильтры и сортировки каталога: каждая страница - range scan по индексу
+CATALOG_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS dishes_category_id_idx ON dishes (category, id);",
+    "CREATE INDEX IF NOT EXISTS dishes_rating_id_idx ON dishes (rating, id);",
+    "CREATE INDEX IF NOT EXISTS dishes_price_id_idx ON dishes (price, id);",
+    "CREATE INDEX IF NOT EXISTS dishes_delivery_time_id_idx ON dishes (delivery_time, id);",
+    "CREATE INDEX IF NOT EXISTS dishes_category_rating_id_idx ON dishes (category, rating, id);",
+    "CREATE INDEX IF NOT EXISTS dishes_category_price_id_idx ON dishes (category, price, id);",
+    "CREATE INDEX IF NOT EXISTS dishes_category_delivery_time_id_idx ON dishes (category, delivery_time, id);",
+]
+
+# Версия каталога: увеличивается триггером на любое изменение dishes.
+# Из неё строятся ETag/Last-Modified, а триггер заодно шлёт NOTIFY catalog_changed.
+CATALOG_VERSION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS catalog_version
+    (
+        id         INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version    BIGINT      NOT NULL DEFAULT 1,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    "INSERT INTO catalog_version (id) VALUES (1) ON CONFLICT DO NOTHING;",
+    """
+    CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS
+    $$
+    BEGIN
+        UPDATE catalog_version SET version = version + 1, updated_at = now() WHERE id = 1;
+        PERFORM pg_notify('catalog_changed', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS dishes_catalog_version ON dishes;",
+    """
+    CREATE TRIGGER dishes_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+        ON dishes
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_catalog_version();
+    """,
+]
+
+# Поиск: tsvector по name/description + триграммы по name (опечатки, typeahead)
+DISHES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    """
+    ALTER TABLE dishes
+        ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(description, '')), 'B')
+            ) STORED;
+    """,
+    "CREATE INDEX IF NOT EXISTS dishes_search_vector_idx ON dishes USING gin (search_vector);",
+    "CREATE INDEX IF NOT EXISTS dishes_name_trgm_idx ON dishes USING gin (name gin_trgm_ops);",
+]
+
+# Сводка по категориям, которую поддерживают триггеры на dishes (без GROUP BY на каждый запрос).
+# Блюда без категории хранятся под ключом ''.
+CATEGORY_STATS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS category_stats
+    (
+        category            VARCHAR(100) PRIMARY KEY,
+        dish_count          BIGINT         NOT NULL DEFAULT 0,
+        price_sum           NUMERIC        NOT NULL DEFAULT 0,
+        price_min           DECIMAL(10, 2),
+        price_max           DECIMAL(10, 2),
+        rating_sum          NUMERIC        NOT NULL DEFAULT 0,
+        rating_count        BIGINT         NOT NULL DEFAULT 0,
+        delivery_time_sum   BIGINT         NOT NULL DEFAULT 0,
+        delivery_time_count BIGINT         NOT NULL DEFAULT 0
+    );
+    """,
+    """
+    CREATE OR REPLACE FUNCTION category_stats_maintain() RETURNS trigger AS
+    $$
+    DECLARE
+        cat TEXT;
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM category_stats;
+            RETURN NULL;
+        END IF;
+
+        -- Вычитаем старые строки (UPDATE/DELETE)
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE category_stats s
+            SET dish_count          = s.dish_count - d.dish_count,
+                price_sum           = s.price_sum - d.price_sum,
+                rating_sum          = s.rating_sum - d.rating_sum,
+                rating_count        = s.rating_count - d.rating_count,
+                delivery_time_sum   = s.delivery_time_sum - d.delivery_time_sum,
+                delivery_time_count = s.delivery_time_count - d.delivery_time_count
+            FROM (SELECT coalesce(category, '')          AS category,
+                         count(*)                        AS dish_count,
+                         sum(price)                      AS price_sum,
+                         coalesce(sum(rating), 0)        AS rating_sum,
+                         count(rating)                   AS rating_count,
+                         coalesce(sum(delivery_time), 0) AS delivery_time_sum,
+                         count(delivery_time)            AS delivery_time_count
+                  FROM old_rows
+                  GROUP BY 1) d
+            WHERE s.category = d.category;
+        END IF;
+
+        -- Добавляем новые строки (INSERT/UPDATE)
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO category_stats AS s (category, dish_count, price_sum, price_min, price_max,
+                                             rating_sum, rating_count, delivery_time_sum, delivery_time_count)
+            SELECT coalesce(category, ''),
+                   count(*),
+                   sum(price),
+                   min(price),
+                   max(price),
+                   coalesce(sum(rating), 0),
+                   count(rating),
+                   coalesce(sum(delivery_time), 0),
+                   count(delivery_time)
+            FROM new_rows
+            GROUP BY 1
+            ON CONFLICT (category) DO UPDATE
+                SET dish_count          = s.dish_count + EXCLUDED.dish_count,
+                    price_sum           = s.price_sum + EXCLUDED.price_sum,
+                    price_min           = LEAST(s.price_min, EXCLUDED.price_min),
+                    price_max           = GREATEST(s.price_max, EXCLUDED.price_max),
+                    rating_sum          = s.rating_sum + EXCLUDED.rating_sum,
+                    rating_count        = s.rating_count + EXCLUDED.rating_count,
+                    delivery_time_sum   = s.delivery_time_sum + EXCLUDED.delivery_time_sum,
+                    delivery_time_count = s.delivery_time_count + EXCLUDED.delivery_time_count;
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM category_stats WHERE dish_count <= 0;
+
+            -- min/max нельзя вычесть: пересчитываем по индексу (category, price, id)
+            FOR cat IN SELECT DISTINCT coalesce(category, '') FROM old_rows
+                LOOP
+                    IF cat = '' THEN
+                        UPDATE category_stats
+                        SET price_min = (SELECT min(price) FROM dishes WHERE category IS NULL),
+                            price_max = (SELECT max(price) FROM dishes WHERE category IS NULL)
+                        WHERE category = '';
+                    ELSE
+                        UPDATE category_stats
+                        SET price_min = (SELECT min(price) FROM dishes WHERE category = cat),
+                            price_max = (SELECT max(price) FROM dishes WHERE category = cat)
+                        WHERE category = cat;
+                    END IF;
+                END LOOP;
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    # Триггер с transition tables может слушать только одно событие
+    "DROP TRIGGER IF EXISTS dishes_category_stats_insert ON dishes;",
+    """
+    CREATE TRIGGER dishes_category_stats_insert
+        AFTER INSERT ON dishes
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION category_stats_maintain();
+    """,
+    "DROP TRIGGER IF EXISTS dishes_category_stats_update ON dishes;",
+    """
+    CREATE TRIGGER dishes_category_stats_update
+        AFTER UPDATE ON dishes
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION category_stats_maintain();
+    """,
+    "DROP TRIGGER IF EXISTS dishes_category_stats_delete ON dishes;",
+    """
+    CREATE TRIGGER dishes_category_stats_delete
+        AFTER DELETE ON dishes
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION category_stats_maintain();
+    """,
+    "DROP TRIGGER IF EXISTS dishes_category_stats_truncate ON dishes;",
+    """
+    CREATE TRIGGER dishes_category_stats_truncate
+        AFTER TRUNCATE ON dishes
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION category_stats_maintain();
+    """,
+    # Начальное заполнение по уже существующим блюдам
+    "DELETE FROM category_stats;",
+    """
+    INSERT INTO category_stats (category, dish_count, price_sum, price_min, price_max,
+                                rating_sum, rating_count, delivery_time_sum, delivery_time_count)
+    SELECT coalesce(category, ''),
+           count(*),
+           sum(price),
+           min(price),
+           max(price),
+           coalesce(sum(rating), 0),
+           count(rating),
+           coalesce(sum(delivery_time), 0),
+           count(delivery_time)
+    FROM dishes
+    GROUP BY 1;
+    """,
+]
+
+# Покрывающие индексы для списка (fields=list в catalog.FIELD_PRESETS): страница читается
+# index-only scan, без обращения к таблице. Заменяют обычные индексы с теми же ключами.
+CATALOG_COVERING_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS dishes_list_id_idx ON dishes (id)
+        INCLUDE (name, price, category, delivery_time, rating);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dishes_list_rating_id_idx ON dishes (rating, id)
+        INCLUDE (name, price, category, delivery_time);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dishes_list_category_rating_id_idx ON dishes (category, rating, id)
+        INCLUDE (name, price, delivery_time);
+    """,
+    "DROP INDEX IF EXISTS dishes_rating_id_idx;",
+    "DROP INDEX IF EXISTS dishes_category_rating_id_idx;",
+]
+
+# Delta-sync (/dishes/changes): у каждой строки - xid транзакции, которая её последней
+# записала, удалённые блюда остаются "надгробиями" с xid удаления. Курсор - позиция
+# (change_xid, id), граница выборки - xmin текущего снимка (все более ранние транзакции завершены).
+DISHES_CHANGES_DDL = [
+    "ALTER TABLE dishes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();",
+    # Волатильный DEFAULT: таблица перезаписывается один раз, существующие строки получают xid миграции
+    "ALTER TABLE dishes ADD COLUMN IF NOT EXISTS change_xid XID8 NOT NULL DEFAULT pg_current_xact_id();",
+    "CREATE INDEX IF NOT EXISTS dishes_change_xid_id_idx ON dishes (change_xid, id);",
+    """
+    CREATE OR REPLACE FUNCTION dishes_track_update() RETURNS trigger AS
+    $$
+    BEGIN
+        NEW.updated_at := now();
+        NEW.change_xid := pg_current_xact_id();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    # INSERT (в том числе COPY) обходится значениями по умолчанию - построчный триггер только на UPDATE
+    "DROP TRIGGER IF EXISTS dishes_track_update ON dishes;",
+    """
+    CREATE TRIGGER dishes_track_update
+        BEFORE UPDATE ON dishes
+        FOR EACH ROW
+    EXECUTE FUNCTION dishes_track_update();
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dish_tombstones
+    (
+        id         INTEGER PRIMARY KEY,
+        deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        change_xid XID8        NOT NULL DEFAULT pg_current_xact_id()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS dish_tombstones_change_xid_id_idx ON dish_tombstones (change_xid, id);",
+    """
+    CREATE OR REPLACE FUNCTION dish_tombstones_maintain() RETURNS trigger AS
+    $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO dish_tombstones (id)
+            SELECT id FROM old_rows
+            ON CONFLICT (id) DO UPDATE SET deleted_at = now(), change_xid = pg_current_xact_id();
+        ELSIF TG_OP = 'TRUNCATE' THEN
+            -- BEFORE TRUNCATE: строки ещё на месте
+            INSERT INTO dish_tombstones (id)
+            SELECT id FROM dishes
+            ON CONFLICT (id) DO UPDATE SET deleted_at = now(), change_xid = pg_current_xact_id();
+        ELSE
+            -- id снова занят (TRUNCATE ... RESTART IDENTITY): клиент получит строку, надгробие не нужно.
+            -- Так id всегда либо в dishes, либо в dish_tombstones, и позиция (change_xid, id) уникальна.
+            DELETE FROM dish_tombstones t USING new_rows n WHERE t.id = n.id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS dish_tombstones_delete ON dishes;",
+    """
+    CREATE TRIGGER dish_tombstones_delete
+        AFTER DELETE ON dishes
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION dish_tombstones_maintain();
+    """,
+    "DROP TRIGGER IF EXISTS dish_tombstones_truncate ON dishes;",
+    """
+    CREATE TRIGGER dish_tombstones_truncate
+        BEFORE TRUNCATE ON dishes
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION dish_tombstones_maintain();
+    """,
+    "DROP TRIGGER IF EXISTS dish_tombstones_insert ON dishes;",
+    """
+    CREATE TRIGGER dish_tombstones_insert
+        AFTER INSERT ON dishes
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+    EXECUTE FUNCTION dish_tombstones_maintain();
+    """,
+]
+
+# (версия, имя, список SQL). Новые миграции только добавляются в конец.
+# now() - время начала транзакции: длинная транзакция, закоммиченная после короткой,
+# сдвигала updated_at (Last-Modified) назад, и If-Modified-Since получал ложный 304
+CATALOG_VERSION_MONOTONIC_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS
+    $$
+    BEGIN
+        UPDATE catalog_version
+        SET version    = version + 1,
+            updated_at = GREATEST(updated_at, clock_timestamp())
+        WHERE id = 1;
+        PERFORM pg_notify('catalog_changed', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+]
+
+# Typeahead: ближайшие по названию кандидаты (ORDER BY text <<-> name) - KNN умеет только GiST
+DISHES_NAME_KNN_DDL = [
+    "CREATE INDEX IF NOT EXISTS dishes_name_trgm_gist_idx ON dishes USING gist (name gist_trgm_ops);",
+]
+
+MIGRATIONS = [
+    (1, "create_dishes", DISHES_DDL),
+    (2, "dishes_delivery_time_rating", DISHES_COLUMNS_DDL),
+    (3, "catalog_indexes", CATALOG_INDEXES),
+    (4, "catalog_version", CATALOG_VERSION_DDL),
+    (5, "dishes_search", DISHES_SEARCH_DDL),
+    (6, "category_stats", CATEGORY_STATS_DDL),
+    (7, "catalog_covering_indexes", CATALOG_COVERING_INDEXES),
+    (8, "dishes_changes", DISHES_CHANGES_DDL),
+    (9, "catalog_version_monotonic", CATALOG_VERSION_MONOTONIC_DDL),
+    (10, "dishes_name_trgm_knn", DISHES_NAME_KNN_DDL),
+]
+
+
+async def run_migrations():
+    """Применить недостающие миграции. Возвращает список применённых имён.
+
+    Каждая миграция выполняется в своей транзакции и записывается в
+    schema_migrations; advisory lock не даёт воркерам применять их параллельно.
+    """
+    applied_now = []
+
+    async with await psycopg.AsyncConnection.connect(get_conninfo(), autocommit=True) as conn:
+        await conn.execute("SELECT pg_advisory_lock(%s);", (MIGRATIONS_LOCK_ID,))
+        try:
+            await conn.execute("""
+                               CREATE TABLE IF NOT EXISTS schema_migrations
+                               (
+                                   version    INTEGER PRIMARY KEY,
+                                   name       VARCHAR(255) NOT NULL,
+                                   applied_at TIMESTAMPTZ DEFAULT now()
+                               );
+                               """)
+            cur = await conn.execute("SELECT version FROM schema_migrations;")
+            applied = {row[0] for row in await cur.fetchall()}
+
+            for version, name, statements in MIGRATIONS:
+                if version in applied:
+                    continue
+
+                async with conn.transaction():
+                    for statement in statements:
+                        await conn.execute(statement)
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                        (version, name),
+                    )
+                print(f"Applied migration {version}: {name}")
+                applied_now.append(name)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s);", (MIGRATIONS_LOCK_ID,))
+
+    return applied_now
+
+
+def migrations_enabled():
+    """Миграции при старте можно отключить через RUN_MIGRATIONS=0"""
+    return os.getenv("RUN_MIGRATIONS", "1") != "0"
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+from http_cache import catalog_headers
+
+
+def orjson_default(value):
+    """Типы, которые orjson не сериализует сам (datetime/date/UUID он умеет)"""
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+def dumps(content):
+    """JSON в bytes через orjson"""
+    return orjson.dumps(content, default=orjson_default)
+
+
+def to_ndjson(rows):
+    """Пачка строк в формате NDJSON (по JSON-объекту на строку)"""
+    return b"".join(dumps(row) + b"\n" for row in rows)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse на orjson.
+
+    Если вернуть из обработчика уже готовый FastJSONResponse, FastAPI
+    пропускает jsonable_encoder - на больших выборках это основная экономия.
+    """
+
+    def render(self, content):
+        return dumps(content)
+
+
+def cached_json_response(cached, encoding, version=None):
+    """Ответ из CachedBody: сжатый вариант берётся из кэша, а не сжимается заново.
+
+    С версией каталога - ETag/Last-Modified того представления, которое реально
+    отдаётся (маленькие тела не сжимаются, и ETag у них без суффикса кодирования).
+    """
+    body, content_encoding = cached.get(encoding)
+    headers = catalog_headers(version, content_encoding) if version is not None else {}
+    headers["Vary"] = "Accept-Encoding"
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
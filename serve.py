@@ -0,0 +1,75 @@
+"""Продакшен-запуск: несколько воркеров uvicorn по числу доступных ядер.
+
+    python serve.py
+
+WEB_CONCURRENCY - число воркеров (по умолчанию - доступные процессу ядра с
+учётом лимита CPU контейнера). У каждого воркера свои пулы соединений; размеры
+пулов по умолчанию делят между воркерами общий бюджет DB_MAX_CONNECTIONS (см. db.py).
+Каждый воркер прогревается в lifespan (см. warmup.py) до приёма запросов.
+"""
+import math
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+
+def available_cpus():
+    """Ядра, доступные процессу: affinity и квота cgroup (cpu.max / cfs_quota)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def main():
+    workers = int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+    # Воркеры наследуют окружение: по нему db.py делит бюджет соединений
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Метрики всех воркеров собираются через общий каталог (см. metrics.render_metrics)
+        multiproc_dir = tempfile.mkdtemp(prefix="eatly-prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiproc_dir
+    else:
+        multiproc_dir = None
+
+    print(f"Starting {workers} worker(s)")
+    try:
+        uvicorn.run(
+            "main:app",
+            host=os.getenv("HOST", "0.0.0.0"),
+            port=int(os.getenv("PORT", "8000")),
+            workers=workers,
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+        )
+    finally:
+        if multiproc_dir is not None:
+            shutil.rmtree(multiproc_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
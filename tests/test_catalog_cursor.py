@@ -0,0 +1,119 @@
+"""Курсоры /dishes и переход в NULL-фазу - без БД"""
+import base64
+import json
+from decimal import Decimal
+
+import pytest
+
+from catalog import (
+    InvalidCursor, build_dishes_query, decode_cursor, encode_cursor, merge_null_phase, paginate, parse_fields,
+)
+
+FILTERS = dict.fromkeys(("category", "min_price", "max_price", "max_delivery_time", "min_rating"))
+
+
+def make_cursor(payload):
+    raw = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def dish(dish_id, rating):
+    return {"id": dish_id, "name": f"Dish {dish_id}", "rating": rating}
+
+
+@pytest.mark.parametrize("sort, value, expected", [
+    ("id", 42, 42),
+    ("price", 12.99, Decimal("12.99")),
+    ("rating", Decimal("4.8"), Decimal("4.8")),
+    ("delivery_time", 25, 25),
+    ("rating", None, None),
+])
+def test_cursor_round_trip(sort, value, expected):
+    cursor = encode_cursor(sort, "desc", value, 42)
+    assert decode_cursor(cursor, sort, "desc") == {"value": expected, "id": 42}
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    make_cursor(["rating", "desc"]),
+    make_cursor({"sort": "price", "order": "asc", "value": "abc", "id": 1}),
+    make_cursor({"sort": "price", "order": "asc", "value": ["1"], "id": 1}),
+    make_cursor({"sort": "price", "order": "asc", "value": 1.5, "id": 1}),
+    make_cursor({"sort": "price", "order": "asc", "value": "NaN", "id": 1}),
+    make_cursor({"sort": "price", "order": "asc", "value": "Infinity", "id": 1}),
+    make_cursor({"sort": "price", "order": "asc", "value": "1", "id": "x"}),
+    make_cursor({"sort": "price", "order": "asc", "value": "1", "id": -1}),
+    make_cursor({"sort": "price", "order": "asc", "value": "1", "id": 2 ** 31}),
+    make_cursor({"sort": "price", "order": "asc", "value": "1"}),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "price", "asc")
+
+
+@pytest.mark.parametrize("value", ["1.5", "abc", str(2 ** 31)])
+def test_invalid_delivery_time_value(value):
+    cursor = make_cursor({"sort": "delivery_time", "order": "asc", "value": value, "id": 1})
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "delivery_time", "asc")
+
+
+def test_cursor_for_other_sort_is_rejected():
+    cursor = encode_cursor("rating", "desc", Decimal("4.5"), 7)
+    with pytest.raises(InvalidCursor, match="different sort order"):
+        decode_cursor(cursor, "rating", "asc")
+    with pytest.raises(InvalidCursor, match="different sort order"):
+        decode_cursor(cursor, "price", "desc")
+
+
+def test_merge_null_phase_fills_page():
+    dishes = [dish(1, 4.9)]
+    nulls = [dish(5, None), dish(6, None), dish(7, None)]
+    # limit 2: одна строка со значением + две из NULL-фазы (лишняя - признак has_more)
+    assert merge_null_phase(dishes, nulls, 2) == [dish(1, 4.9), dish(5, None), dish(6, None)]
+
+
+def test_merge_null_phase_skips_nulls_when_page_is_full():
+    dishes = [dish(1, 4.9), dish(2, 4.8), dish(3, 4.7)]
+    assert merge_null_phase(dishes, [dish(5, None)], 2) == dishes
+
+
+def test_last_page_has_no_cursor():
+    rows = [dish(1, 4.9), dish(2, None)]
+    assert paginate(rows, 2, "rating", "desc") == (rows, None)
+
+
+def test_transition_into_null_phase():
+    rows = merge_null_phase([dish(1, 4.9)], [dish(5, None), dish(6, None)], 2)
+    page, cursor = paginate(rows, 2, "rating", "desc")
+    assert page == [dish(1, 4.9), dish(5, None)]
+
+    # Последняя строка страницы - из NULL-фазы: следующая страница только в ней, после id 5
+    after = decode_cursor(cursor, "rating", "desc")
+    assert after == {"value": None, "id": 5}
+    query, params = build_dishes_query(FILTERS, "rating", "desc", after, after["value"] is None, 3)
+    assert "IS NULL" in repr(query)
+    assert params == [5, 3]
+
+
+def test_cursor_inside_value_phase():
+    page, cursor = paginate([dish(1, 4.9), dish(2, 4.8), dish(3, 4.7)], 2, "rating", "desc")
+    assert page == [dish(1, 4.9), dish(2, 4.8)]
+
+    after = decode_cursor(cursor, "rating", "desc")
+    assert after == {"value": Decimal("4.8"), "id": 2}
+    query, params = build_dishes_query(FILTERS, "rating", "desc", after, False, 3)
+    assert "IS NOT NULL" in repr(query)
+    assert params == [Decimal("4.8"), 2, 3]
+
+
+def test_compact_cursor_uses_column_positions():
+    columns = parse_fields("name,price", "price")
+    rows = [tuple(row[column] for column in columns) for row in (
+        {"id": 3, "name": "Soup", "price": 5.5},
+        {"id": 8, "name": "Cake", "price": 6.25},
+        {"id": 9, "name": "Tea", "price": 7.0},
+    )]
+    page, cursor = paginate(rows, 2, "price", "asc", columns)
+    assert page == rows[:2]
+    assert decode_cursor(cursor, "price", "asc") == {"value": Decimal("6.25"), "id": 8}
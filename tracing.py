@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+import psycopg
+from psycopg import sql
+from starlette.datastructures import Headers, MutableHeaders
+
+
+# QUERY_TRACE: "0" - выключено, "1" - для всех запросов, "header" - только с заголовком X-Query-Trace: 1
+QUERY_TRACE = os.getenv("QUERY_TRACE", "0")
+# Запросы дольше порога пишутся в лог eatly.slow_query
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Для медленных SELECT дополнительно снимать EXPLAIN (ANALYZE, BUFFERS) - запрос выполнится повторно
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "0") == "1"
+
+EXPLAINABLE_OPERATIONS = ("select", "with")
+MAX_STATEMENT_LENGTH = 2000
+
+slow_query_logger = logging.getLogger("eatly.slow_query")
+query_trace_logger = logging.getLogger("eatly.query_trace")
+
+
+def configure_logging():
+    """Обработчик для логгеров eatly.*: uvicorn настраивает только свои логгеры,
+    а root остаётся на WARNING - без этого трассы (INFO) молча отбрасываются.
+    """
+    logger = logging.getLogger("eatly")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO" if QUERY_TRACE != "0" else "WARNING").upper())
+    logger.propagate = False
+
+
+configure_logging()
+
+# Трасса текущего запроса (None - трассировка для запроса выключена)
+request_trace = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Все запросы к БД, выполненные при обработке одного HTTP-запроса"""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+
+    def server_timing(self, total):
+        return (f'db;dur={self.db_time * 1000:.2f};desc="{len(self.queries)} queries", '
+                f'total;dur={total * 1000:.2f}')
+
+
+def statement_text(cursor, query):
+    """Текст запроса для логов (без параметров - в них могут быть данные клиентов)"""
+    try:
+        if isinstance(query, sql.Composable):
+            query = query.as_string(cursor)
+        elif isinstance(query, bytes):
+            query = query.decode(errors="replace")
+    except Exception:
+        query = repr(query)
+    return " ".join(query.split())[:MAX_STATEMENT_LENGTH]
+
+
+def trace_query(cursor, query, operation, elapsed, rowcount, batch=None):
+    """Записать выполненный запрос в трассу и слоу-лог.
+
+    batch - размер пакета pipeline mode: elapsed тогда время всего пакета, и в
+    db_time запрос вносит свою долю, чтобы пакет не учитывался batch раз.
+    Возвращает True, если запрос медленный и для него нужно снять EXPLAIN -
+    тогда в лог его пишет вызывающий код вместе с планом.
+    """
+    trace = request_trace.get()
+    if trace is not None:
+        trace.db_time += elapsed / batch if batch else elapsed
+        entry = {
+            "statement": statement_text(cursor, query),
+            "ms": round(elapsed * 1000, 3),
+            "rows": rowcount,
+        }
+        if batch:
+            entry["pipeline"] = batch
+        trace.queries.append(entry)
+
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return False
+    if SLOW_QUERY_EXPLAIN and operation in EXPLAINABLE_OPERATIONS:
+        return True
+    log_slow_query(cursor, query, elapsed, rowcount)
+    return False
+
+
+def log_slow_query(cursor, query, elapsed, rowcount, plan=None):
+    entry = {
+        "event": "slow_query",
+        "ms": round(elapsed * 1000, 3),
+        "rows": rowcount,
+        "statement": statement_text(cursor, query),
+    }
+    if plan is not None:
+        entry["plan"] = plan
+    slow_query_logger.warning(json.dumps(entry, default=str))
+
+
+def _explain_statement(query):
+    if not isinstance(query, sql.Composable):
+        query = sql.SQL(query.decode() if isinstance(query, bytes) else query)
+    return sql.SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ") + query
+
+
+def explain_query(cursor, query, params):
+    """План медленного запроса. Выполняется в savepoint, ошибка не ломает транзакцию."""
+    try:
+        with cursor.connection.transaction():
+            with psycopg.Cursor(cursor.connection) as explain_cursor:
+                explain_cursor.execute(_explain_statement(query), params)
+                return explain_cursor.fetchone()[0]
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+
+
+async def explain_query_async(cursor, query, params):
+    """Асинхронный вариант explain_query"""
+    try:
+        async with cursor.connection.transaction():
+            async with psycopg.AsyncCursor(cursor.connection) as explain_cursor:
+                await explain_cursor.execute(_explain_statement(query), params)
+                return (await explain_cursor.fetchone())[0]
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+
+
+def _trace_requested(scope):
+    if QUERY_TRACE == "1":
+        return True
+    if QUERY_TRACE == "header":
+        return Headers(scope=scope).get("x-query-trace") == "1"
+    return False
+
+
+class QueryTraceMiddleware:
+    """Трассировка запросов к БД: заголовки Server-Timing / X-DB-Queries и лог eatly.query_trace"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _trace_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = request_trace.set(trace)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", trace.server_timing(time.perf_counter() - started))
+                headers["X-DB-Queries"] = str(len(trace.queries))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_trace.reset(token)
+            query_trace_logger.info(json.dumps({
+                "event": "query_trace",
+                "method": scope["method"],
+                "path": scope["path"],
+                "total_ms": round((time.perf_counter() - started) * 1000, 3),
+                "db_ms": round(trace.db_time * 1000, 3),
+                "queries": trace.queries,
+            }))
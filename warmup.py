@@ -0,0 +1,70 @@
+import os
+import time
+from urllib.parse import urlsplit
+
+from db import warm_pools
+
+
+# Что запросить при старте воркера: кэш каталога, prepared statements и сжатые варианты тел
+WARMUP_PATHS = [
+    path.strip()
+    for path in os.getenv("WARMUP_PATHS", "/categories,/dishes,/dishes?fields=list").split(",")
+    if path.strip()
+]
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+
+
+async def _asgi_get(app, path, accept_encoding="br"):
+    """GET через ASGI-приложение в том же процессе (со всеми middleware). Возвращает статус."""
+    url = urlsplit(path)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"warmup"), (b"accept-encoding", accept_encoding.encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 0),
+        "app": app,
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def warm_up(app):
+    """Прогрев воркера до приёма трафика: соединения пулов и кэш каталога.
+
+    Ошибки не мешают старту - воркер просто начнёт работу "холодным".
+    """
+    started = time.perf_counter()
+    try:
+        await warm_pools(WARMUP_TIMEOUT)
+    except Exception as e:
+        # БД недоступна - запросы каталога ждали бы таймаут пула, не прогреваем
+        print(f"⚠️ Pool warmup failed, starting cold: {e}")
+        return
+
+    for path in WARMUP_PATHS:
+        try:
+            status = await _asgi_get(app, path)
+        except Exception as e:
+            status = e
+        if status != 200:
+            print(f"⚠️ Warmup {path}: {status}")
+
+    print(f"✅ Worker {os.getpid()} warmed up in {time.perf_counter() - started:.2f}s")